@@ -1,12 +1,17 @@
 # commerce_app/api/analytics.py
-from fastapi import APIRouter
-from datetime import date, timedelta
+from fastapi import APIRouter, Request, Response
+from datetime import date
+import numpy as np
+from commerce_app.api.http_cache import not_modified
 
 router = APIRouter(prefix="/api", tags=["analytics"])
 
 
 @router.get("/orders/summary")
-def orders_summary():
+def orders_summary(request: Request, response: Response):
+    cached = not_modified(request, response)
+    if cached:
+        return cached
     # mock data for now
     return {
         "total_orders": 4213,
@@ -16,9 +21,12 @@ def orders_summary():
 
 
 @router.get("/orders/revenue-by-day")
-def revenue_by_day(days: int = 30):
-    out = []
-    for i in range(days):
-        d = date.today() - timedelta(days=days - i)
-        out.append({"date": d.isoformat(), "revenue": 3000 + (i * 37) % 900})
-    return out
+def revenue_by_day(request: Request, response: Response, days: int = 30):
+    cached = not_modified(request, response, days)
+    if cached:
+        return cached
+    idx = np.arange(days)
+    rev = (3000 + (idx * 37) % 900).tolist()
+    base = np.datetime64(date.today(), "D") - (days - idx)
+    dates = base.astype(str).tolist()
+    return [{"date": d, "revenue": r} for d, r in zip(dates, rev)]
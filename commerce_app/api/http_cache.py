@@ -0,0 +1,77 @@
+# commerce_app/api/http_cache.py
+import hashlib
+from datetime import date
+from typing import Optional
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+CACHE_CONTROL = "public, max-age=300"
+
+# Per-shop data behind a session token: browsers may keep it, but must
+# revalidate with If-None-Match before every reuse
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    RFC 9110 If-None-Match evaluation: "*" matches any current
+    representation, otherwise the header is a comma-separated list of
+    entity tags compared weakly (a W/ prefix on either side is ignored).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    wanted = _opaque(etag)
+    return any(_opaque(tag) == wanted for tag in if_none_match.split(","))
+
+
+def not_modified(request: Request, response: Response, *key) -> Optional[Response]:
+    """
+    Tag a response whose content only depends on today's date, the request
+    path and `key`. Returns a 304 response if the client already holds this
+    version, otherwise sets ETag/Cache-Control on `response` and returns None.
+    """
+    seed = f"{date.today()}:{request.url.path}:{key}"
+    digest = hashlib.blake2b(seed.encode(), digest_size=8).hexdigest()
+    headers = {"ETag": f'"{digest}"', "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+class ETagRoute(APIRoute):
+    """
+    Route class for read endpoints over shop data: successful GET responses
+    get a strong ETag of their body, and a matching If-None-Match is
+    answered with an empty 304. Shop data has no cheap version stamp, so
+    the handler still runs; the client skips the download and re-render.
+    Streaming responses (exports) are passed through untouched.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            response = await handler(request)
+            body = getattr(response, "body", None)
+            if request.method != "GET" or response.status_code != 200 or body is None:
+                return response
+            etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            headers = {
+                "ETag": etag,
+                "Cache-Control": PRIVATE_CACHE_CONTROL,
+                "Vary": "Authorization",
+            }
+            if etag_matches(request.headers.get("if-none-match"), etag):
+                return Response(status_code=304, headers=headers)
+            response.headers.update(headers)
+            return response
+
+        return route_handler
@@ -1,12 +1,34 @@
-from datetime import date, timedelta
+from fastapi import APIRouter, Request, Response
+from datetime import date
+from functools import lru_cache
+import numpy as np
+from commerce_app.api.http_cache import not_modified
+
+router = APIRouter(prefix="/api", tags=["sales"])
+
+# Baseline: exponentially weighted level of the last 14 days, projected forward
+HIST = np.array(
+    [3000, 3200, 3100, 3400, 3600, 3550, 3700, 3800, 3950, 4100, 3900, 4000, 4200, 4300],
+    dtype=np.float64,
+)
+ALPHA = 0.3
+_weights = (1 - ALPHA) ** np.arange(len(HIST) - 1, -1, -1)
+LEVEL = round(float(_weights @ HIST / _weights.sum()), 2)
+
+
+@lru_cache(maxsize=8)
+def _build(today_ordinal: int, days: int) -> tuple:
+    idx = np.arange(1, days + 1)
+    dates = (np.datetime64(date.fromordinal(today_ordinal), "D") + idx).astype(str).tolist()
+    forecast = np.full(len(idx), LEVEL).tolist()
+    return tuple(
+        {"date": d, "forecast_revenue": f} for d, f in zip(dates, forecast)
+    )
+
 
 @router.get("/sales/forecast")
-def sales_forecast(days:int=14):
-    # naive baseline: last 14 days avg projected forward
-    hist = [3000, 3200, 3100, 3400, 3600, 3550, 3700, 3800, 3950, 4100, 3900, 4000, 4200, 4300]
-    avg = sum(hist) / len(hist)
-    out = []
-    for i in range(days):
-        d = date.today() + timedelta(days=i+1)
-        out.append({"date": d.isoformat(), "forecast_revenue": round(avg,2)})
-    return out
+def sales_forecast(request: Request, response: Response, days: int = 14):
+    cached = not_modified(request, response, days)
+    if cached:
+        return cached
+    return _build(date.today().toordinal(), days)
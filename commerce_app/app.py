@@ -4,16 +4,18 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os, uvicorn, math, logging
-from fastapi import FastAPI, Request, Depends, HTTPException, Header
-from fastapi.responses import HTMLResponse, JSONResponse
+import orjson
+from fastapi import FastAPI, Request, Response, Depends, HTTPException, Header
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse
 from fastapi.templating import Jinja2Templates
 from commerce_app.billing import require_active_subscription
 
 from commerce_app.integrations.shopify.shopify_client import get_orders, get_customers
 from commerce_app.core.routers.analytics import router as analytics_router
 from commerce_app.core.db import init_pool, close_pool
+from commerce_app.core.http import close_client
 from commerce_app.core.routers import webhooks, health, analytics
-from commerce_app.auth.shopify_oauth import router as shopify_auth
+from commerce_app.auth.shopify_oauth import router as shopify_auth, stop_log_listener
 from commerce_app.core.routers import cogs
 from commerce_app.core.routers.gdpr_webhooks import router as gdpr_router
 from commerce_app.core.routers.Forecasts import router as forecasts_router
@@ -25,22 +27,40 @@ from commerce_app.billing import router as billing_router
 # Session token verifier
 from commerce_app.auth.session_tokens import verify_shopify_session_token
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 templates = Jinja2Templates(directory="commerce_app/ui")
+# Templates are baked into the image: skip the per-render mtime check
+templates.env.auto_reload = False
 
 # Security headers middleware for Shopify embedding
-from starlette.middleware.base import BaseHTTPMiddleware
-
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
-        # CRITICAL: Allow Shopify to embed your app in an iframe
-        response.headers["Content-Security-Policy"] = (
-            "frame-ancestors https://admin.shopify.com https://*.myshopify.com"
-        )
-        if "X-Frame-Options" in response.headers:
-            del response.headers["X-Frame-Options"]
-        return response
+_CSP_HEADER = (
+    b"content-security-policy",
+    b"frame-ancestors https://admin.shopify.com https://*.myshopify.com",
+)
+_REPLACED_HEADERS = (b"content-security-policy", b"x-frame-options")
+
+class SecurityHeadersMiddleware:
+    """Plain ASGI middleware: rewrites headers on http.response.start only."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                # CRITICAL: Allow Shopify to embed your app in an iframe
+                headers = [
+                    h for h in message.get("headers", ())
+                    if h[0].lower() not in _REPLACED_HEADERS
+                ]
+                headers.append(_CSP_HEADER)
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
 
 # Add security headers middleware FIRST
 app.add_middleware(SecurityHeadersMiddleware)
@@ -129,9 +149,13 @@ app.include_router(gdpr_router, prefix="/webhooks", tags=["gdpr"])
 app.include_router(health.router)
 app.include_router(shopify_auth)  # OAuth routes at /auth/*
 
+# Probe bodies are constant: serialize once, wrap in a fresh Response per hit
+# (CORSMiddleware appends to the response's header list in place)
+_HEALTH_BODY = b'{"status":"ok"}'
+
 @app.get("/healthz")
-def healthz():
-    return {"status": "ok"}
+async def healthz():
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 # Optional: protected endpoint to verify session tokens are working
 @app.get("/api/me", tags=["auth-probe"])
@@ -158,12 +182,34 @@ async def startup_event():
         logging.info("✅ Billing columns initialized")
     except Exception as e:
         logging.error(f"❌ Failed to initialize billing columns: {e}")
-# Logging routes
-for r in app.routes:
-    logging.warning("ROUTE %s %s", getattr(r, "path", ""), getattr(r, "methods", ""))
+
+@app.on_event("startup")
+async def _ensure_webhook_columns():
+    """Add the webhook registration bookkeeping columns if missing"""
+    from commerce_app.auth.shopify_oauth import ensure_webhook_columns
+    try:
+        await ensure_webhook_columns()
+        logging.info("✅ Webhook columns initialized")
+    except Exception as e:
+        logging.error(f"❌ Failed to initialize webhook columns: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the shared outbound HTTP client and flush queued sync logs"""
+    await close_client()
+    stop_log_listener()
+
+@app.on_event("startup")
+async def _log_routes():
+    """Log the route table once per worker when LOG_ROUTES is set"""
+    if os.environ.get("LOG_ROUTES"):
+        for r in app.routes:
+            logging.info("ROUTE %s %s", getattr(r, "path", ""), getattr(r, "methods", ""))
 
 BUILD_ID = os.environ.get("BUILD_ID", "dev")
 
+_WHOAMI_BODY = orjson.dumps({"module": "commerce_app.app", "build_id": BUILD_ID})
+
 @app.get("/whoami")
-def whoami():
-    return {"module": "commerce_app.app", "build_id": BUILD_ID}
\ No newline at end of file
+async def whoami():
+    return Response(content=_WHOAMI_BODY, media_type="application/json")
\ No newline at end of file
@@ -1,22 +1,45 @@
-import base64, hashlib, hmac, time, urllib.parse as urlparse
-from typing import Dict, Optional
+import hashlib, hmac, random, re, secrets, time, urllib.parse as urlparse
+from typing import Iterable, Optional, Tuple
 from fastapi import APIRouter, Request, Response, HTTPException, BackgroundTasks
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 import httpx, os, json, asyncio
-from datetime import datetime
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import orjson
+from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager, suppress
 from dotenv import load_dotenv
-import logging
+import logging, logging.handlers, queue, sys
+from collections import Counter
+from psycopg.rows import dict_row
+from commerce_app.core.db import get_conn
+from commerce_app.core.http import get_client
+from commerce_app.core.routers.webhooks import copy_orders, order_row, upsert_products
 
 
 logger = logging.getLogger(__name__)
+
+# Sync jobs log from the event loop; hand records to a background thread so
+# stdout writes never block it
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler(sys.stdout)
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+
+def stop_log_listener() -> None:
+    """Flush queued log records and stop the writer thread; call on shutdown."""
+    _log_listener.stop()
+
 load_dotenv()
 
 router = APIRouter(prefix="/auth", tags=["shopify-auth"])
 
 SHOPIFY_API_KEY = os.environ["SHOPIFY_API_KEY"]
 SHOPIFY_API_SECRET = os.environ["SHOPIFY_API_SECRET"]
+_SECRET_BYTES = SHOPIFY_API_SECRET.encode()
 APP_URL = os.environ["APP_URL"].rstrip("/")
 FRONTEND_URL = os.environ.get("FRONTEND_URL", "https://app.lodestaranalytics.io")
 SCOPES = (
@@ -25,41 +48,525 @@ SCOPES = (
 )
 GRANT_PER_USER = os.environ.get("GRANT_OPTIONS_PER_USER", "false").lower() == "true"
 
+# OAuth authorize URL: everything but shop and state is fixed at import
+_SCOPE_ENC = urlparse.quote(SCOPES)
+_REDIRECT_ENC = urlparse.quote(APP_URL + "/auth/callback")
+_PERM_TMPL = (
+    "https://{shop}/admin/oauth/authorize"
+    f"?client_id={SHOPIFY_API_KEY}"
+    f"&scope={_SCOPE_ENC}"
+    f"&redirect_uri={_REDIRECT_ENC}"
+    "&state={state}"
+) + ("&grant_options[]=per-user" if GRANT_PER_USER else "")
+
+# Post-install landing page in the merchant's admin, minus the shop host
+_ADMIN_APPS_SUFFIX = f"/admin/apps/{SHOPIFY_API_KEY}"
+
+# Webhook topics registered on install. _WEBHOOK_SIG changes whenever the
+# topic set or callback address does, forcing re-registration.
+_WEBHOOK_TOPICS = (
+    "ORDERS_CREATE",
+    "ORDERS_UPDATED",
+    "PRODUCTS_CREATE",
+    "PRODUCTS_UPDATE",
+    "CUSTOMERS_CREATE",
+    "CUSTOMERS_UPDATE",
+    "APP_SUBSCRIPTIONS_UPDATE",
+)
+_WEBHOOK_URI = f"{APP_URL}/webhooks/ingest"
+_WEBHOOK_SIG = json.dumps([sorted(_WEBHOOK_TOPICS), _WEBHOOK_URI])
+_WEBHOOK_TTL = "7 days"
+
+# One aliased webhookSubscriptionCreate per topic, serialized once since
+# nothing in the request body depends on the shop
+_WEBHOOK_MUTATION_BODY = orjson.dumps({
+    "query": "mutation {\n" + "".join(
+        f"  w{i}: webhookSubscriptionCreate(topic: {topic}, "
+        f"webhookSubscription: {{uri: {orjson.dumps(_WEBHOOK_URI).decode()}, format: JSON}}) "
+        "{ webhookSubscription { id } userErrors { field message } }\n"
+        for i, topic in enumerate(_WEBHOOK_TOPICS)
+    ) + "}"
+})
+
+# Embedded-admin bounce page; shop is regex-validated and state is URL-safe,
+# so both are spliced in as bytes between fixed halves
+_BOUNCE_PREFIX = (
+    "<!doctype html><html><head><script>"
+    f'window.top.location.href = "{APP_URL}/auth/top?shop='
+).encode()
+_BOUNCE_MID = b"&state="
+_BOUNCE_SUFFIX = b'";</script></head><body></body></html>'
+
+# Bulk operation status poll. Only the operation id varies, so the document
+# is built once and the id is sent as a GraphQL variable.
+_BULK_STATUS_QUERY = """
+query($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation {
+      id status errorCode objectCount url partialDataUrl
+    }
+  }
+}
+"""
+
+# Status polls start almost immediately so small jobs are picked up fast,
+# then back off gently (with jitter) so long-running jobs poll rarely
+_POLL_BASE_DELAY = 0.05
+_POLL_BACKOFF = 1.3
+_POLL_MAX_DELAY = 8.0
+
+
+
+# Shared read-only fallback for missing nested objects in bulk rows
+_EMPTY: dict = {}
+
+
+def _gid_id(gid: Optional[str]) -> Optional[str]:
+    """Numeric tail of a Shopify GID ("gid://shopify/Order/123" -> "123")."""
+    return gid[gid.rfind("/") + 1:] if gid else None
+
+
+# GID prefixes used to dispatch bulk JSONL rows by type
+_ORDER_GID = "gid://shopify/Order/"
+_LINE_ITEM_GID = "gid://shopify/LineItem/"
+_PRODUCT_GID = "gid://shopify/Product/"
+_VARIANT_GID = "gid://shopify/ProductVariant/"
+
+
+# (query-string key, customer_journey utm_parameters key), in output order
+_UTM_PARAMS = (
+    ("utm_source", "source"),
+    ("utm_medium", "medium"),
+    ("utm_campaign", "campaign"),
+    ("utm_content", "content"),
+    ("utm_term", "term"),
+)
+
+# Bulk operation launcher; the bulk query document travels as a variable,
+# so it needs no escaping into the mutation text
+_BULK_RUN_MUTATION = """
+mutation($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+
+# Bulk query documents for the bulk syncs. They never vary, so the full
+# bulkOperationRunQuery request bodies are serialized once.
+# Orders deliberately omit customer visit / attribution fields; those come
+# from the REST customer_journey endpoint per order.
+_ORDERS_BULK_QUERY = """
+{
+  orders {
+    edges {
+      node {
+        id
+        name
+        email
+        createdAt
+        updatedAt
+        totalPriceSet { shopMoney { amount currencyCode } }
+        subtotalPriceSet { shopMoney { amount } }
+        totalTaxSet { shopMoney { amount } }
+        displayFinancialStatus
+        displayFulfillmentStatus
+        customer { id email }
+        lineItems {
+          edges {
+            node {
+              id
+              title
+              quantity
+              originalUnitPriceSet { shopMoney { amount } }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+_PRODUCTS_BULK_QUERY = """
+{
+  products {
+    edges {
+      node {
+        id
+        title
+        handle
+        vendor
+        productType
+        tags
+        status
+        createdAt
+        updatedAt
+        variants {
+          edges {
+            node {
+              id
+              title
+              price
+              sku
+              position
+              inventoryPolicy
+              compareAtPrice
+              createdAt
+              updatedAt
+              taxable
+              barcode
+              selectedOptions {
+                name
+                value
+              }
+              inventoryItem {
+                id
+                tracked
+                requiresShipping
+                measurement {
+                  weight {
+                    unit
+                    value
+                  }
+                }
+              }
+              inventoryQuantity
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+_VARIANTS_BULK_QUERY = """
+{
+  productVariants {
+    edges {
+      node {
+        id
+        title
+        price
+        sku
+        position
+        inventoryPolicy
+        compareAtPrice
+        createdAt
+        updatedAt
+        taxable
+        barcode
+        selectedOptions {
+          name
+          value
+        }
+        inventoryItem {
+          id
+          tracked
+          requiresShipping
+          measurement {
+            weight {
+              unit
+              value
+            }
+          }
+        }
+        inventoryQuantity
+        product {
+          id
+        }
+      }
+    }
+  }
+}
+"""
+
+_LINE_ITEMS_BULK_QUERY = """
+{
+  orders {
+    edges {
+      node {
+        id
+        name
+        lineItems {
+          edges {
+            node {
+              id
+              title
+              quantity
+              variantTitle
+              name
+              sku
+              variant {
+                id
+              }
+              product {
+                id
+              }
+              originalUnitPriceSet {
+                shopMoney {
+                  amount
+                  currencyCode
+                }
+              }
+              discountedUnitPriceSet {
+                shopMoney {
+                  amount
+                  currencyCode
+                }
+              }
+              originalTotalSet {
+                shopMoney {
+                  amount
+                }
+              }
+              discountedTotalSet {
+                shopMoney {
+                  amount
+                }
+              }
+              taxable
+              requiresShipping
+              fulfillableQuantity
+              fulfillmentStatus
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+_ORDERS_BULK_BODY = orjson.dumps(
+    {"query": _BULK_RUN_MUTATION, "variables": {"query": _ORDERS_BULK_QUERY}}
+)
+_PRODUCTS_BULK_BODY = orjson.dumps(
+    {"query": _BULK_RUN_MUTATION, "variables": {"query": _PRODUCTS_BULK_QUERY}}
+)
+_VARIANTS_BULK_BODY = orjson.dumps(
+    {"query": _BULK_RUN_MUTATION, "variables": {"query": _VARIANTS_BULK_QUERY}}
+)
+_LINE_ITEMS_BULK_BODY = orjson.dumps(
+    {"query": _BULK_RUN_MUTATION, "variables": {"query": _LINE_ITEMS_BULK_QUERY}}
+)
+
+
+# Variant upsert for the standalone variants sync. Unlike the product
+# webhook upsert it leaves fulfillment_service, old_inventory_quantity and
+# product_id untouched on conflict.
+_SYNC_VARIANT_SQL = """
+    INSERT INTO shopify.product_variants (
+        shop_id, variant_id, product_id, title, price, sku,
+        position, inventory_policy, compare_at_price,
+        option1, option2, option3, created_at, updated_at,
+        taxable, barcode, weight, weight_unit,
+        inventory_item_id, inventory_quantity,
+        inventory_management, requires_shipping
+    ) VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+        %s, %s, %s, %s, %s, %s, %s, %s
+    )
+    ON CONFLICT (shop_id, variant_id)
+    DO UPDATE SET
+        title = EXCLUDED.title,
+        price = EXCLUDED.price,
+        sku = EXCLUDED.sku,
+        position = EXCLUDED.position,
+        inventory_policy = EXCLUDED.inventory_policy,
+        compare_at_price = EXCLUDED.compare_at_price,
+        option1 = EXCLUDED.option1,
+        option2 = EXCLUDED.option2,
+        option3 = EXCLUDED.option3,
+        updated_at = EXCLUDED.updated_at,
+        taxable = EXCLUDED.taxable,
+        barcode = EXCLUDED.barcode,
+        weight = EXCLUDED.weight,
+        weight_unit = EXCLUDED.weight_unit,
+        inventory_item_id = EXCLUDED.inventory_item_id,
+        inventory_quantity = EXCLUDED.inventory_quantity,
+        inventory_management = EXCLUDED.inventory_management,
+        requires_shipping = EXCLUDED.requires_shipping
+    """
+
+
+_SYNC_LINE_ITEM_SQL = """
+    INSERT INTO shopify.order_line_items (
+        shop_id, order_id, line_number, product_id, variant_id,
+        title, quantity,
+        price, total_discount
+    ) VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s, %s
+    )
+    ON CONFLICT (shop_id, order_id, line_number)
+    DO UPDATE SET
+        product_id = EXCLUDED.product_id,
+        variant_id = EXCLUDED.variant_id,
+        title = EXCLUDED.title,
+        quantity = EXCLUDED.quantity,
+        price = EXCLUDED.price,
+        total_discount = EXCLUDED.total_discount
+    """
+
 
-def db():
-    # Build from components instead of DATABASE_URL
-    DB_HOST = os.getenv("DB_HOST")
-    DB_NAME = os.getenv("DB_NAME")
-    DB_USER = os.getenv("DB_USER")
-    DB_PASSWORD = os.getenv("DB_PASSWORD")
-    DB_PORT = os.getenv("DB_PORT", "5432")
-    return psycopg2.connect(
-        f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?sslmode=require",
-        cursor_factory=RealDictCursor,
+_SYNC_CUSTOMER_SQL = """
+    INSERT INTO shopify.customers (
+        shop_id, customer_id, email, first_name, last_name,
+        accepts_marketing, created_at, updated_at, phone,
+        total_spent, orders_count, state, raw_json
+    ) VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
     )
+    ON CONFLICT (shop_id, customer_id)
+    DO UPDATE SET
+        email = EXCLUDED.email,
+        first_name = EXCLUDED.first_name,
+        last_name = EXCLUDED.last_name,
+        accepts_marketing = EXCLUDED.accepts_marketing,
+        updated_at = EXCLUDED.updated_at,
+        phone = EXCLUDED.phone,
+        orders_count = EXCLUDED.orders_count,
+        state = EXCLUDED.state,
+        raw_json = EXCLUDED.raw_json
+    """
+
+
+# shop -> [lock, waiters]; entries are dropped when the last holder leaves.
+# Locks are per process, so they only serialize callers within one worker.
+_shop_locks: dict = {}
+
+
+@asynccontextmanager
+async def _shop_lock(shop: str, locks: dict = _shop_locks):
+    entry = locks.get(shop)
+    if entry is None:
+        entry = locks[shop] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del locks[shop]
+
+
+# shop_domain -> (fetched_at, shop_id, access_token). The cache is per
+# process and the OAuth callback only clears it in the worker that handled
+# it, so the TTL is kept short: other workers see a reinstall's new token
+# within a few seconds.
+_SHOP_CACHE_TTL = 5.0
+_shop_cache: dict[str, tuple[float, int, str]] = {}
+_shop_cache_locks: dict = {}
+
+
+async def get_shop_creds(shop_domain: str) -> Optional[tuple[int, str]]:
+    """Return (shop_id, access_token) for a shop, or None if it is not installed."""
+    entry = _shop_cache.get(shop_domain)
+    if entry and time.monotonic() - entry[0] < _SHOP_CACHE_TTL:
+        return entry[1], entry[2]
+    async with _shop_lock(shop_domain, _shop_cache_locks):
+        # Another caller may have filled the entry while we waited
+        entry = _shop_cache.get(shop_domain)
+        if entry and time.monotonic() - entry[0] < _SHOP_CACHE_TTL:
+            return entry[1], entry[2]
+        async with get_conn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "SELECT shop_id, access_token FROM shopify.shops WHERE shop_domain = %s",
+                    (shop_domain,),
+                    prepare=True,
+                )
+                row = await cur.fetchone()
+        if not row or not row[1]:
+            _shop_cache.pop(shop_domain, None)
+            return None
+        _shop_cache[shop_domain] = (time.monotonic(), row[0], row[1])
+        return row[0], row[1]
+
+
+# Client-side mirror of Shopify's REST leaky bucket (40 request burst,
+# leaking 2/s per shop), so REST callers wait here instead of on a 429.
+# Buckets live in process memory: with WEB_CONCURRENCY > 1 every worker
+# paces itself separately.
+_REST_BUCKET_SIZE = 40
+_REST_LEAK_RATE = 2.0
+
+# shop -> [level, last_leak, lock, users]
+_rest_buckets: dict = {}
+
+
+def _prune_rest_buckets(now: float) -> None:
+    """Drop buckets nobody is using that have fully drained."""
+    for shop, entry in list(_rest_buckets.items()):
+        if not entry[3] and entry[0] <= (now - entry[1]) * _REST_LEAK_RATE:
+            del _rest_buckets[shop]
+
+
+async def _rest_slot(shop: str) -> None:
+    """Wait until the shop's REST bucket has room for one more request."""
+    entry = _rest_buckets.get(shop)
+    if entry is None:
+        now = time.monotonic()
+        _prune_rest_buckets(now)
+        entry = _rest_buckets[shop] = [0.0, now, asyncio.Lock(), 0]
+    entry[3] += 1
+    try:
+        async with entry[2]:
+            while True:
+                now = time.monotonic()
+                entry[0] = max(0.0, entry[0] - (now - entry[1]) * _REST_LEAK_RATE)
+                entry[1] = now
+                overflow = entry[0] + 1 - _REST_BUCKET_SIZE
+                if overflow <= 0:
+                    entry[0] += 1
+                    return
+                await asyncio.sleep(overflow / _REST_LEAK_RATE)
+    finally:
+        entry[3] -= 1
+
+
+# Cursor of the rel="next" entry in a REST Link header; a header can also
+# carry a rel="previous" entry, which must not be picked up
+_PAGE_INFO_RE = re.compile(r'<([^>]*[?&]page_info=([^>&]+)[^>]*)>;\s*rel="next"')
+
+_SHOP_RE = re.compile(r"[a-z0-9][a-z0-9\-]{0,59}\.myshopify\.com", re.ASCII).fullmatch
 
 
 def is_valid_shop(shop: str) -> bool:
-    return shop.endswith(".myshopify.com") and shop.count(".") >= 2 and "/" not in shop
+    return _SHOP_RE(shop) is not None
+
 
+def sign_hmac(secret: bytes, message: str) -> bytes:
+    return hmac.digest(secret, message.encode(), "sha256")
 
-def sign_hmac(secret: str, message: str) -> str:
-    return hmac.new(secret.encode(), message.encode(), hashlib.sha256).hexdigest()
 
+def verify_hmac(secret: bytes, items: Iterable[Tuple[str, str]]) -> bool:
+    """Check Shopify's query-string HMAC over (key, value) pairs, e.g. multi_items()."""
+    provided = ""
+    pairs = []
+    for k, v in items:
+        if k == "hmac":
+            provided = v
+        elif k != "signature":
+            pairs.append((k, v))
+    pairs.sort()
+    msg = "&".join(f"{k}={v}" for k, v in pairs)
+    try:
+        provided_digest = bytes.fromhex(provided)
+    except ValueError:
+        return False
+    return hmac.compare_digest(sign_hmac(secret, msg), provided_digest)
 
-def verify_hmac(secret: str, query: Dict[str, str]) -> bool:
-    q = {k: v for k, v in query.items() if k not in ("hmac", "signature")}
-    pairs = [f"{k}={v}" for k, v in sorted(q.items(), key=lambda kv: kv[0])]
-    msg = "&".join(pairs)
-    computed = sign_hmac(secret, msg)
-    provided = query.get("hmac", "")
-    return hmac.compare_digest(computed, provided)
+
+# Embedded apps run in a cross-site iframe, so cookies need SameSite=None
+_COOKIE_KW = {"httponly": True, "secure": True, "samesite": "none"}
 
 
 def set_cookie(response: Response, name: str, value: str, max_age: int = 300):
-    response.set_cookie(
-        name, value, max_age=max_age, httponly=True, secure=True, samesite="none"
-    )
+    response.set_cookie(name, value, max_age=max_age, **_COOKIE_KW)
 
 
 def get_cookie(request: Request, name: str) -> Optional[str]:
@@ -69,94 +576,97 @@ def get_cookie(request: Request, name: str) -> Optional[str]:
 # ============================================================================
 # SYNC PROGRESS HELPERS
 # ============================================================================
-async def update_sync_progress(
-    shop_id: int,
-    stage: str,
-    status: str = "in_progress",
-    count: int = 0,
-    error: str = None
-):
+# One statement per stage, touching only that stage's counter
+# Stages only write their own counters; the shared sync_current_stage and
+# sync_stage_status columns are written by run_sequential_sync alone (and by
+# mark_sync_failed), since customers and products run at the same time
+_PROGRESS_SQL = {
+    stage: f"""
+        UPDATE shopify.shops
+        SET sync_{stage}_count = %s, updated_at = NOW()
+        WHERE shop_id = %s
+        """
+    for stage in ("customers", "products", "orders", "line_items")
+}
+
+_CURRENT_STAGE_SQL = """
+    UPDATE shopify.shops
+    SET sync_current_stage = %s, sync_stage_status = 'in_progress'
+    WHERE shop_id = %s
+"""
+
+_STAGE_COMPLETE_SQL = {
+    stage: f"""
+        UPDATE shopify.shops
+        SET sync_{stage}_count = %(count)s, sync_{stage}_completed = TRUE{extra}
+        WHERE shop_id = %(shop_id)s
+        """
+    for stage, extra in (
+        ("customers", ""),
+        ("products", ""),
+        ("orders", ", initial_sync_order_count = %(count)s"),
+        ("line_items", ""),
+    )
+}
+
+# Minimum seconds between in-progress counter writes from a sync loop
+_PROGRESS_INTERVAL = 5.0
+
+# Bulk ingest loops write in small batches but only commit (and pay the WAL
+# flush) once this many rows are pending; failed batches roll back to a
+# savepoint instead
+_COMMIT_EVERY = 10_000
+
+
+async def update_sync_progress(shop_id: int, stage: str, count: int = 0):
     """
-    Update sync progress in database.
+    Update a stage's synced-item counter in database.
     
     Args:
         shop_id: The shop's database ID
-        stage: Current sync stage ('customers', 'products', 'orders', 'line_items')
-        status: Status of the stage ('pending', 'in_progress', 'completed', 'failed')
+        stage: Sync stage ('customers', 'products', 'orders', 'line_items')
         count: Number of items synced for this stage
-        error: Error message if failed
     """
-    from commerce_app.core.db import get_conn
-    
     try:
         async with get_conn() as conn:
             async with conn.cursor() as cur:
                 await cur.execute(
-                    """
-                    UPDATE shopify.shops 
-                    SET 
-                        sync_current_stage = %s,
-                        sync_stage_status = %s,
-                        sync_customers_count = CASE WHEN %s = 'customers' THEN %s ELSE sync_customers_count END,
-                        sync_products_count = CASE WHEN %s = 'products' THEN %s ELSE sync_products_count END,
-                        sync_orders_count = CASE WHEN %s = 'orders' THEN %s ELSE sync_orders_count END,
-                        sync_line_items_count = CASE WHEN %s = 'line_items' THEN %s ELSE sync_line_items_count END,
-                        sync_error = %s,
-                        updated_at = NOW()
-                    WHERE shop_id = %s
-                    """,
-                    (
-                        stage, status,
-                        stage, count,
-                        stage, count,
-                        stage, count,
-                        stage, count,
-                        error,
-                        shop_id
-                    ),
+                    _PROGRESS_SQL[stage],
+                    (count, shop_id),
+                    prepare=True,
                 )
                 await conn.commit()
     except Exception as e:
-        print(f"Failed to update sync progress: {e}")
+        logger.error(f"Failed to update sync progress: {e}")
+
+
+async def set_current_stage(shop_id: int, stage: str):
+    """Record which stage the status endpoint reports as running."""
+    try:
+        async with get_conn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(_CURRENT_STAGE_SQL, (stage, shop_id), prepare=True)
+                await conn.commit()
+    except Exception as e:
+        logger.error(f"Failed to update current sync stage: {e}")
 
 
 async def mark_sync_stage_complete(shop_id: int, stage: str, count: int):
     """Mark a specific sync stage as completed."""
-    from commerce_app.core.db import get_conn
-    
     try:
         async with get_conn() as conn:
             async with conn.cursor() as cur:
                 # Update the specific stage count and mark as completed
-                if stage == 'customers':
-                    await cur.execute(
-                        "UPDATE shopify.shops SET sync_customers_count = %s, sync_customers_completed = TRUE WHERE shop_id = %s",
-                        (count, shop_id)
-                    )
-                elif stage == 'products':
-                    await cur.execute(
-                        "UPDATE shopify.shops SET sync_products_count = %s, sync_products_completed = TRUE WHERE shop_id = %s",
-                        (count, shop_id)
-                    )
-                elif stage == 'orders':
-                    await cur.execute(
-                        "UPDATE shopify.shops SET sync_orders_count = %s, sync_orders_completed = TRUE, initial_sync_order_count = %s WHERE shop_id = %s",
-                        (count, count, shop_id)
-                    )
-                elif stage == 'line_items':
-                    await cur.execute(
-                        "UPDATE shopify.shops SET sync_line_items_count = %s, sync_line_items_completed = TRUE WHERE shop_id = %s",
-                        (count, shop_id)
-                    )
+                sql = _STAGE_COMPLETE_SQL.get(stage)
+                if sql:
+                    await cur.execute(sql, {"count": count, "shop_id": shop_id}, prepare=True)
                 await conn.commit()
     except Exception as e:
-        print(f"Failed to mark sync stage complete: {e}")
+        logger.error(f"Failed to mark sync stage complete: {e}")
 
 
 async def mark_full_sync_complete(shop_id: int):
     """Mark the entire sync process as completed."""
-    from commerce_app.core.db import get_conn
-    
     try:
         async with get_conn() as conn:
             async with conn.cursor() as cur:
@@ -170,17 +680,16 @@ async def mark_full_sync_complete(shop_id: int):
                         sync_stage_status = 'completed'
                     WHERE shop_id = %s
                     """,
-                    (shop_id,)
+                    (shop_id,),
+                    prepare=True,
                 )
                 await conn.commit()
     except Exception as e:
-        print(f"Failed to mark full sync complete: {e}")
+        logger.error(f"Failed to mark full sync complete: {e}")
 
 
 async def mark_sync_failed(shop_id: int, error_message: str, stage: str = None):
     """Mark sync as failed in database."""
-    from commerce_app.core.db import get_conn
-    
     try:
         async with get_conn() as conn:
             async with conn.cursor() as cur:
@@ -195,119 +704,124 @@ async def mark_sync_failed(shop_id: int, error_message: str, stage: str = None):
                         sync_error = %s
                     WHERE shop_id = %s
                     """,
-                    (error_message, stage or 'unknown', error_message, shop_id)
+                    (error_message, stage or 'unknown', error_message, shop_id),
+                    prepare=True,
                 )
                 await conn.commit()
     except Exception as e:
-        print(f"Failed to mark sync as failed: {e}")
+        logger.error(f"Failed to mark sync as failed: {e}")
 
 
-async def register_webhooks(shop: str, access_token: str):
+def _webhooks_hash(access_token: str) -> str:
     """
-    Register webhooks with Shopify after app installation.
+    Fingerprint of the webhook set registered for a given token.
+
+    Uninstalling revokes the token and drops the app's subscriptions, so a
+    reinstall gets a new token and therefore a new hash.
     """
-    webhooks_to_create = [
-        {"topic": "orders/create", "address": f"{APP_URL}/webhooks/ingest"},
-        {"topic": "orders/updated", "address": f"{APP_URL}/webhooks/ingest"},
-        {"topic": "products/create", "address": f"{APP_URL}/webhooks/ingest"},
-        {"topic": "products/update", "address": f"{APP_URL}/webhooks/ingest"},
-        {"topic": "customers/create", "address": f"{APP_URL}/webhooks/ingest"},
-        {"topic": "customers/update", "address": f"{APP_URL}/webhooks/ingest"},
-        {"topic": "app_subscriptions/update", "address": f"{APP_URL}/webhooks/ingest"},
-    ]
-
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        for webhook_config in webhooks_to_create:
-            try:
-                response = await client.post(
-                    f"https://{shop}/admin/api/2025-10/webhooks.json",
-                    headers={
-                        "X-Shopify-Access-Token": access_token,
-                        "Content-Type": "application/json",
-                    },
-                    json={"webhook": webhook_config},
-                )
+    return hashlib.sha256(f"{_WEBHOOK_SIG}:{access_token}".encode()).hexdigest()
 
-                if response.status_code == 201:
-                    print(f"✅ Registered webhook: {webhook_config['topic']} for {shop}")
-                elif response.status_code == 422:
-                    print(
-                        f"⚠️  Webhook already exists: {webhook_config['topic']} for {shop}"
-                    )
-                else:
-                    print(
-                        f"❌ Failed to register webhook {webhook_config['topic']}: {response.text}"
-                    )
 
-            except Exception as e:
-                print(f"❌ Error registering webhook {webhook_config['topic']}: {e}")
+async def ensure_webhook_columns():
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                ALTER TABLE shopify.shops
+                ADD COLUMN IF NOT EXISTS webhooks_hash VARCHAR(64),
+                ADD COLUMN IF NOT EXISTS webhooks_registered_at TIMESTAMPTZ;
+            """)
+            await conn.commit()
 
+    logger.info("Webhook columns ensured in DB.")
 
-async def initial_data_sync(shop: str, shop_id: int, access_token: str):
+
+async def register_webhooks(shop: str, access_token: str):
     """
-    Bulk sync orders (WITHOUT customerJourneySummary) and then,
-    for each order, fetch attribution using the REST endpoint:
-    GET /orders/<id>/customer_journey.json
+    Register webhooks with Shopify after app installation.
+
+    All topics are created in a single GraphQL request, one aliased
+    webhookSubscriptionCreate per topic. When every topic is live the
+    shop's webhooks_hash is stamped so a later callback can skip this.
     """
-    print(f"🔄 Starting bulk initial sync for {shop}")
+    topics = _WEBHOOK_TOPICS
 
-    from commerce_app.core.db import get_conn
-    from commerce_app.core.routers.webhooks import process_order_webhook
+    try:
+        response = await get_client().post(
+            f"https://{shop}/admin/api/2025-10/graphql.json",
+            headers={
+                "X-Shopify-Access-Token": access_token,
+                "Content-Type": "application/json",
+            },
+            content=_WEBHOOK_MUTATION_BODY,
+            timeout=20.0,
+        )
+        if response.status_code != 200:
+            logger.error(f"❌ Failed to register webhooks for {shop}: {response.text}")
+            return
+        body = response.json()
+    except Exception as e:
+        logger.error(f"❌ Error registering webhooks for {shop}: {e}")
+        return
+
+    if body.get("errors"):
+        logger.error(f"❌ Failed to register webhooks for {shop}: {body['errors']}")
+        return
+
+    data = body.get("data") or {}
+    ok = 0
+    for i, topic in enumerate(topics):
+        result = data.get(f"w{i}") or {}
+        errors = result.get("userErrors") or []
+        if not errors:
+            ok += 1
+            logger.info(f"✅ Registered webhook: {topic} for {shop}")
+        elif any("taken" in (err.get("message") or "") for err in errors):
+            ok += 1
+            logger.warning(f"⚠️  Webhook already exists: {topic} for {shop}")
+        else:
+            logger.error(f"❌ Failed to register webhook {topic}: {errors}")
 
-    await update_sync_progress(shop_id, "orders", "in_progress", 0)
+    logger.info(f"📋 Webhooks for {shop}: {ok}/{len(topics)} registered")
 
-    # ------------------------------------------------------------
-    # 1. BULK QUERY — *NO CUSTOMER VISIT / ATTRIBUTION FIELDS*
-    # ------------------------------------------------------------
-    bulk_query = """
-    {
-      orders {
-        edges {
-          node {
-            id
-            name
-            email
-            createdAt
-            updatedAt
-            totalPriceSet { shopMoney { amount currencyCode } }
-            subtotalPriceSet { shopMoney { amount } }
-            totalTaxSet { shopMoney { amount } }
-            displayFinancialStatus
-            displayFulfillmentStatus
-            customer { id email }
-            lineItems {
-              edges {
-                node {
-                  id
-                  title
-                  quantity
-                  originalUnitPriceSet { shopMoney { amount } }
-                }
-              }
-            }
-          }
-        }
-      }
-    }
+    if ok == len(topics):
+        try:
+            async with get_conn() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        """
+                        UPDATE shopify.shops
+                        SET webhooks_hash = %s, webhooks_registered_at = now()
+                        WHERE shop_domain = %s
+                        """,
+                        (_webhooks_hash(access_token), shop),
+                    )
+                    await conn.commit()
+        except Exception as e:
+            logger.warning(f"⚠️  Failed to record webhook registration for {shop}: {e}")
+
+
+async def poll_bulk_operation(
+    client: httpx.AsyncClient,
+    shop: str,
+    access_token: str,
+    operation_id: str,
+    max_wait: float = 600,
+) -> Tuple[Optional[str], Optional[str]]:
     """
+    Poll a bulk operation until it reaches a terminal status.
 
-    escaped_query = (
-        bulk_query.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
-    )
+    Returns (status, url): the result URL when COMPLETED, the partial data
+    URL when FAILED/CANCELED/EXPIRED, or (None, None) after max_wait seconds.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_wait
+    attempt = 0
+
+    while loop.time() < deadline:
+        delay = min(_POLL_MAX_DELAY, _POLL_BASE_DELAY * _POLL_BACKOFF ** attempt)
+        await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+        attempt += 1
 
-    mutation = f'''
-    mutation {{
-      bulkOperationRunQuery(query: "{escaped_query}") {{
-        bulkOperation {{ id status }}
-        userErrors {{ field message }}
-      }}
-    }}
-    '''
-
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        # ------------------------------------------------------------
-        # 2. START BULK OPERATION
-        # ------------------------------------------------------------
         try:
             response = await client.post(
                 f"https://{shop}/admin/api/2025-10/graphql.json",
@@ -315,741 +829,618 @@ async def initial_data_sync(shop: str, shop_id: int, access_token: str):
                     "X-Shopify-Access-Token": access_token,
                     "Content-Type": "application/json",
                 },
-                json={"query": mutation},
+                json={"query": _BULK_STATUS_QUERY, "variables": {"id": operation_id}},
             )
-            data = response.json()
-
-            user_errors = (
-                data.get("data", {})
-                .get("bulkOperationRunQuery", {})
-                .get("userErrors")
-            )
-
-            if user_errors:
-                print("❌ Bulk query error:", user_errors)
-                await mark_sync_failed(shop_id, str(user_errors), "orders")
-                return 0
-
-            operation_id = (
-                data["data"]["bulkOperationRunQuery"]["bulkOperation"]["id"]
-            )
-            print(f"✅ Started bulk operation: {operation_id}")
-
+            if response.status_code != 200:
+                continue
+            operation = (response.json().get("data") or _EMPTY).get("node") or _EMPTY
         except Exception as e:
-            await mark_sync_failed(shop_id, str(e), "orders")
-            return 0
-
-        # ------------------------------------------------------------
-        # 3. POLL UNTIL COMPLETE
-        # ------------------------------------------------------------
-        status_query = f"""
-        query {{
-          node(id: "{operation_id}") {{
-            ... on BulkOperation {{
-              id status errorCode objectCount url partialDataUrl
-            }}
-          }}
-        }}
-        """
+            logger.error(f"Error polling bulk operation {operation_id}: {e}")
+            continue
 
-        jsonl_url = None
-        start_time = asyncio.get_event_loop().time()
+        status = operation.get("status")
+        logger.debug(f"📊 Bulk status: {status} ({operation.get('objectCount', 0)} objects)")
 
-        while True:
-            if asyncio.get_event_loop().time() - start_time > 600:
-                await mark_sync_failed(shop_id, "Timeout", "orders")
-                return 0
-
-            resp = await client.post(
-                f"https://{shop}/admin/api/2025-10/graphql.json",
-                headers={"X-Shopify-Access-Token": access_token},
-                json={"query": status_query},
-            )
-            op = resp.json()["data"]["node"]
+        if status == "COMPLETED":
+            return status, operation.get("url")
+        if status in ("FAILED", "CANCELED", "EXPIRED"):
+            return status, operation.get("partialDataUrl")
 
-            print(f"📊 Bulk status: {op['status']} ({op.get('objectCount')})")
+    return None, None
 
-            if op["status"] == "COMPLETED":
-                jsonl_url = op["url"]
-                break
-            if op["status"] in ("FAILED", "CANCELED", "EXPIRED"):
-                jsonl_url = op["partialDataUrl"]
-                break
 
-            await asyncio.sleep(2)
+_ATTRIBUTION_WORKERS = 4
+_ATTRIBUTION_BATCH = 500
 
-        # ------------------------------------------------------------
-        # 4. DOWNLOAD JSONL
-        # ------------------------------------------------------------
-        if not jsonl_url:
-            await mark_sync_failed(shop_id, "No data URL", "orders")
-            return 0
+_ORDER_ATTRIBUTION_SQL = """
+    UPDATE shopify.orders
+    SET raw_json = jsonb_set(raw_json::jsonb, '{attribution_landing_site}', to_jsonb(%s::text))
+    WHERE shop_id = %s AND order_id = %s
+"""
 
-        resp = await client.get(jsonl_url, timeout=120.0)
-        lines = resp.text.strip().split("\n")
 
-        total_orders = 0
+async def _fetch_landing_site(
+    client: httpx.AsyncClient, shop: str, access_token: str, order_id: str
+) -> Optional[str]:
+    """First-visit landing page of an order with its UTM parameters, if known."""
+    try:
+        await _rest_slot(shop)
+        attrib_resp = await client.get(
+            f"https://{shop}/admin/api/2025-10/orders/{order_id}/customer_journey.json",
+            headers={"X-Shopify-Access-Token": access_token},
+        )
 
-        async with get_conn() as conn:
-            async with conn.cursor() as cur:
-                # ------------------------------------------------------------
-                # 5. Process each order and fetch attribution via REST
-                # ------------------------------------------------------------
-                for line in lines:
-                    if not line.strip():
-                        continue
+        attrib_data = (
+            attrib_resp.json().get("customer_journey", {})
+            if attrib_resp.status_code == 200 else {}
+        )
 
-                    item = json.loads(line)
+        first = attrib_data.get("first_visit", {})
+        utm = first.get("utm_parameters", {})
 
-                    if "/Order/" not in item.get("id", ""):
-                        continue
+        landing_page = first.get("landing_page")
+        if not landing_page:
+            return None
 
-                    order_id = item["id"].split("/")[-1]
+        qs = urlparse.urlencode(
+            {k: utm[v] for k, v in _UTM_PARAMS if utm.get(v)}
+        )
+        if qs:
+            sep = "&" if "?" in landing_page else "?"
+            return landing_page + sep + qs
+        return landing_page
 
-                    # -----------------------------
-                    # REST Attribution Fetch
-                    # -----------------------------
-                    try:
-                        attrib_resp = await client.get(
-                            f"https://{shop}/admin/api/2025-10/orders/{order_id}/customer_journey.json",
-                            headers={"X-Shopify-Access-Token": access_token},
-                        )
+    except Exception:
+        return None
 
-                        attrib_data = (
-                            attrib_resp.json().get("customer_journey", {}) 
-                            if attrib_resp.status_code == 200 else {}
-                        )
 
-                        first = attrib_data.get("first_visit", {})
-                        utm = first.get("utm_parameters", {})
-
-                        landing_page = first.get("landing_page")
-                        landing_site = None
-
-                        if landing_page:
-                            params = []
-                            if utm.get("source"):
-                                params.append(f"utm_source={utm['source']}")
-                            if utm.get("medium"):
-                                params.append(f"utm_medium={utm['medium']}")
-                            if utm.get("campaign"):
-                                params.append(f"utm_campaign={utm['campaign']}")
-                            if utm.get("content"):
-                                params.append(f"utm_content={utm['content']}")
-                            if utm.get("term"):
-                                params.append(f"utm_term={utm['term']}")
-
-                            if params:
-                                sep = "?" if "?" not in landing_page else "&"
-                                landing_site = landing_page + sep + "&".join(params)
-                            else:
-                                landing_site = landing_page
-
-                    except Exception:
-                        landing_site = None
-
-                    # -----------------------------
-                    # Construct simplified order
-                    # -----------------------------
-                    rest_format_order = {
-                        "id": order_id,
-                        "name": item.get("name"),
-                        "order_number": item.get("name", "").replace("#", ""),
-                        "email": item.get("email"),
-                        "total_price": item.get("totalPriceSet", {})
-                        .get("shopMoney", {})
-                        .get("amount", "0"),
-                        "subtotal_price": item.get("subtotalPriceSet", {})
-                        .get("shopMoney", {})
-                        .get("amount", "0"),
-                        "total_tax": item.get("totalTaxSet", {})
-                        .get("shopMoney", {})
-                        .get("amount", "0"),
-                        "currency": item.get("totalPriceSet", {})
-                        .get("shopMoney", {})
-                        .get("currencyCode", "USD"),
-                        "financial_status": item.get("displayFinancialStatus"),
-                        "fulfillment_status": item.get("displayFulfillmentStatus"),
-                        "created_at": item.get("createdAt"),
-                        "updated_at": item.get("updatedAt"),
-                        "customer": {
-                            "id": item.get("customer", {}).get("id", "").split("/")[-1]
-                            if item.get("customer")
-                            else None
-                        },
-                        "line_items": item.get("lineItems", {}).get("edges", []),
-                        "attribution_landing_site": landing_site,  # NEW
-                    }
-
-                    await process_order_webhook(cur, shop_id, rest_format_order)
-                    total_orders += 1
-
-                    if total_orders % 100 == 0:
-                        await conn.commit()
-                        await update_sync_progress(
-                            shop_id, "orders", "in_progress", total_orders
-                        )
+async def _backfill_order_attribution(
+    client: httpx.AsyncClient,
+    shop: str,
+    shop_id: int,
+    access_token: str,
+    order_ids: list,
+) -> int:
+    """
+    Store each order's landing site in raw_json.
 
+    Neither a download stream nor a pooled connection is held while
+    customer_journey calls wait on the REST bucket; results are written in
+    short transactions per batch.
+    """
+    attributed = 0
+
+    async def worker(pending, found):
+        for order_id in pending:
+            site = await _fetch_landing_site(client, shop, access_token, order_id)
+            if site:
+                found.append((site, shop_id, order_id))
+
+    for start in range(0, len(order_ids), _ATTRIBUTION_BATCH):
+        pending = iter(order_ids[start:start + _ATTRIBUTION_BATCH])
+        found = []
+        await asyncio.gather(
+            *(worker(pending, found) for _ in range(_ATTRIBUTION_WORKERS))
+        )
+        if not found:
+            continue
+        try:
+            async with get_conn() as conn:
+                async with conn.cursor() as cur:
+                    await cur.executemany(_ORDER_ATTRIBUTION_SQL, found)
                 await conn.commit()
+            attributed += len(found)
+        except Exception as e:
+            logger.error(f"Failed to store attribution for {len(found)} orders: {e}")
 
-        # ------------------------------------------------------------
-        # 6. Mark stage complete
-        # ------------------------------------------------------------
-        await mark_sync_stage_complete(shop_id, "orders", total_orders)
-        print(f"✅ Orders synced: {total_orders}")
-        return total_orders
-
+    return attributed
 
 
-async def sync_products(shop: str, shop_id: int, access_token: str):
-    """
-    Fetch ALL products and variants using Shopify Bulk Operations API (GraphQL).
+async def initial_data_sync(shop: str, shop_id: int, access_token: str):
     """
-    print(f"🔄 Starting bulk product sync for {shop}")
-
-    from commerce_app.core.db import get_conn
-    from commerce_app.core.routers.webhooks import process_product_webhook
-
-    # Mark products sync as in progress
-    await update_sync_progress(shop_id, 'products', 'in_progress', 0)
-
-    bulk_query = """
-    {
-      products {
-        edges {
-          node {
-            id
-            title
-            handle
-            vendor
-            productType
-            tags
-            status
-            createdAt
-            updatedAt
-            variants {
-              edges {
-                node {
-                  id
-                  title
-                  price
-                  sku
-                  position
-                  inventoryPolicy
-                  compareAtPrice
-                  createdAt
-                  updatedAt
-                  taxable
-                  barcode
-                  selectedOptions {
-                    name
-                    value
-                  }
-                  inventoryItem {
-                    id
-                    tracked
-                    requiresShipping
-                    measurement {
-                      weight {
-                        unit
-                        value
-                      }
-                    }
-                  }
-                  inventoryQuantity
-                }
-              }
-            }
-          }
-        }
-      }
-    }
+    Bulk sync orders (WITHOUT customerJourneySummary) and then,
+    for each order, fetch attribution using the REST endpoint:
+    GET /orders/<id>/customer_journey.json
     """
+    logger.info(f"🔄 Starting bulk initial sync for {shop}")
 
-    escaped_query = (
-        bulk_query.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
-    )
+    await update_sync_progress(shop_id, "orders", 0)
 
-    mutation = f'''
-    mutation {{
-      bulkOperationRunQuery(query: "{escaped_query}") {{
-        bulkOperation {{ id status }}
-        userErrors {{ field message }}
-      }}
-    }}
-    '''
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            response = await client.post(
-                f"https://{shop}/admin/api/2025-10/graphql.json",
-                headers={
-                    "X-Shopify-Access-Token": access_token,
-                    "Content-Type": "application/json",
-                },
-                json={"query": mutation},
-            )
-
-            if response.status_code != 200:
-                print(f"Failed to start product bulk operation: {response.text}")
-                await update_sync_progress(shop_id, 'products', 'failed', 0, "Failed to start bulk operation")
-                return 0
+    # Shared keep-alive client; closed by the app shutdown hook, not here
+    client = get_client()
+    # ------------------------------------------------------------
+    # 2. START BULK OPERATION
+    # ------------------------------------------------------------
+    try:
+        response = await client.post(
+            f"https://{shop}/admin/api/2025-10/graphql.json",
+            headers={
+                "X-Shopify-Access-Token": access_token,
+                "Content-Type": "application/json",
+            },
+            content=_ORDERS_BULK_BODY,
+        )
+        data = response.json()
 
-            data = response.json()
+        user_errors = (
+            data.get("data", {})
+            .get("bulkOperationRunQuery", {})
+            .get("userErrors")
+        )
 
-            if (
-                "errors" in data
-                or data.get("data", {})
-                .get("bulkOperationRunQuery", {})
-                .get("userErrors")
-            ):
-                print(f"GraphQL errors: {data}")
-                await update_sync_progress(shop_id, 'products', 'failed', 0, "GraphQL errors")
-                return 0
+        if user_errors:
+            logger.error(f"❌ Bulk query error: {user_errors}")
+            await mark_sync_failed(shop_id, str(user_errors), "orders")
+            return None
 
-            operation_id = data["data"]["bulkOperationRunQuery"]["bulkOperation"]["id"]
-            print(f"✅ Started product bulk operation: {operation_id}")
+        operation_id = (
+            data["data"]["bulkOperationRunQuery"]["bulkOperation"]["id"]
+        )
+        logger.info(f"✅ Started bulk operation: {operation_id}")
 
-        except Exception as e:
-            print(f"Error starting product bulk operation: {e}")
-            await update_sync_progress(shop_id, 'products', 'failed', 0, str(e))
-            return 0
-
-        # Poll for completion
-        status_query = """
-        query {
-          node(id: "%s") {
-            ... on BulkOperation {
-              id
-              status
-              errorCode
-              objectCount
-              url
-              partialDataUrl
-            }
-          }
-        }
-        """ % operation_id
+    except Exception as e:
+        await mark_sync_failed(shop_id, str(e), "orders")
+        return None
 
-        jsonl_url = None
-        max_wait = 600
-        start_time = asyncio.get_event_loop().time()
+    # ------------------------------------------------------------
+    # 3. POLL UNTIL COMPLETE
+    # ------------------------------------------------------------
+    status, jsonl_url = await poll_bulk_operation(
+        client, shop, access_token, operation_id
+    )
+    if status is None:
+        await mark_sync_failed(shop_id, "Timeout", "orders")
+        return None
 
-        while True:
-            if asyncio.get_event_loop().time() - start_time > max_wait:
-                print("Product bulk operation timed out")
-                await update_sync_progress(shop_id, 'products', 'failed', 0, "Timeout")
-                return 0
+    # ------------------------------------------------------------
+    # 4. DOWNLOAD JSONL
+    # ------------------------------------------------------------
+    if not jsonl_url:
+        await mark_sync_failed(shop_id, "No data URL", "orders")
+        return None
 
-            await asyncio.sleep(2)
+    total_orders = 0
+    errors = 0
 
-            try:
-                response = await client.post(
-                    f"https://{shop}/admin/api/2025-10/graphql.json",
-                    headers={
-                        "X-Shopify-Access-Token": access_token,
-                        "Content-Type": "application/json",
-                    },
-                    json={"query": status_query},
-                )
+    async with get_conn() as conn:
+        # Orders are staged with COPY and merged in batches; the JSONL is
+        # streamed so rows are applied while the download is in flight
+        async with conn.cursor() as cur, client.stream(
+            "GET", jsonl_url, timeout=120.0
+        ) as resp:
+            order_rows = []
+            committed = 0
+            last_progress = time.monotonic()
+
+            async def flush_orders():
+                nonlocal total_orders, errors, committed, last_progress
+                # Only the batch itself runs under the savepoint; commit and
+                # progress errors must not roll back to a released savepoint
+                try:
+                    await cur.execute("SAVEPOINT orders_batch")
+                    await copy_orders(cur, order_rows)
+                    await cur.execute("RELEASE SAVEPOINT orders_batch")
+                except Exception as e:
+                    logger.error(f"Error merging {len(order_rows)} orders after {total_orders}: {e}")
+                    await cur.execute("ROLLBACK TO SAVEPOINT orders_batch")
+                    errors += len(order_rows)
+                    order_rows.clear()
+                    return
+                total_orders += len(order_rows)
+                order_rows.clear()
+                if total_orders - committed >= _COMMIT_EVERY:
+                    await conn.commit()
+                    committed = total_orders
+                now = time.monotonic()
+                if now - last_progress >= _PROGRESS_INTERVAL:
+                    last_progress = now
+                    await update_sync_progress(
+                        shop_id, "orders", total_orders
+                    )
 
-                if response.status_code != 200:
+            # ------------------------------------------------------------
+            # 5. Process each order
+            # ------------------------------------------------------------
+            async for line in resp.aiter_lines():
+                if not line.strip():
                     continue
 
-                data = response.json()
-                operation = data.get("data", {}).get("node", {})
-                status = operation.get("status")
-
-                print(
-                    f"📊 Product sync status: {status} ({operation.get('objectCount', 0)} objects)"
-                )
+                item = orjson.loads(line)
+                g = item.get
+                item_id = g("id") or ""
 
-                if status == "COMPLETED":
-                    jsonl_url = operation.get("url")
-                    print("✅ Product bulk operation completed")
-                    break
-                elif status in ["FAILED", "CANCELED", "EXPIRED"]:
-                    print(f"Product sync failed: {status}")
-                    jsonl_url = operation.get("partialDataUrl")
-                    break
-
-            except Exception as e:
-                print(f"Error polling product bulk operation: {e}")
-                continue
-
-        if not jsonl_url:
-            print("No product data URL")
-            await update_sync_progress(shop_id, 'products', 'failed', 0, "No data URL")
-            return 0
-
-        # Download and process
-        print("📥 Downloading product data...")
-        try:
-            response = await client.get(jsonl_url, timeout=120.0)
+                if not item_id.startswith(_ORDER_GID):
+                    continue
 
-            if response.status_code != 200:
-                print(f"Failed to download product data: {response.status_code}")
-                await update_sync_progress(shop_id, 'products', 'failed', 0, "Download failed")
-                return 0
+                order_id = item_id[len(_ORDER_GID):]
+
+                # -----------------------------
+                # Construct simplified order
+                # -----------------------------
+                name = g("name")
+                total_money = (g("totalPriceSet") or _EMPTY).get("shopMoney") or _EMPTY
+                customer = g("customer")
+                rest_format_order = {
+                    "id": order_id,
+                    "name": name,
+                    "order_number": (name or "").replace("#", ""),
+                    "email": g("email"),
+                    "total_price": total_money.get("amount", "0"),
+                    "subtotal_price": (
+                        (g("subtotalPriceSet") or _EMPTY).get("shopMoney") or _EMPTY
+                    ).get("amount", "0"),
+                    "total_tax": (
+                        (g("totalTaxSet") or _EMPTY).get("shopMoney") or _EMPTY
+                    ).get("amount", "0"),
+                    "currency": total_money.get("currencyCode", "USD"),
+                    "financial_status": g("displayFinancialStatus"),
+                    "fulfillment_status": g("displayFulfillmentStatus"),
+                    "created_at": g("createdAt"),
+                    "updated_at": g("updatedAt"),
+                    "customer": {
+                        "id": _gid_id(customer.get("id")) if customer else None
+                    },
+                    "line_items": (g("lineItems") or _EMPTY).get("edges", []),
+                    # Filled in by the attribution stage
+                    "attribution_landing_site": None,
+                }
 
-        except Exception as e:
-            print(f"Error downloading product data: {e}")
-            await update_sync_progress(shop_id, 'products', 'failed', 0, str(e))
-            return 0
+                order_rows.append(order_row(shop_id, rest_format_order))
 
-        lines = response.text.strip().split("\n")
-        products_map = {}
+                if len(order_rows) >= 500:
+                    await flush_orders()
 
-        for line in lines:
-            if not line.strip():
-                continue
+            if order_rows:
+                await flush_orders()
+            await conn.commit()
 
-            try:
-                item = json.loads(line)
-                item_id = item.get("id", "")
-
-                if "/Product/" in item_id:
-                    product_id = item_id.split("/")[-1]
-                    products_map[product_id] = {
-                        "id": product_id,
-                        "title": item.get("title"),
-                        "handle": item.get("handle"),
-                        "vendor": item.get("vendor"),
-                        "productType": item.get("productType"),
-                        "tags": item.get("tags"),
-                        "status": item.get("status"),
-                        "createdAt": item.get("createdAt"),
-                        "updatedAt": item.get("updatedAt"),
-                        "variants": [],
-                    }
-                elif "/ProductVariant/" in item_id:
-                    parent_id = item.get("__parentId", "").split("/")[-1]
-                    if parent_id in products_map:
-                        inventory_item = item.get("inventoryItem", {})
-                        measurement = inventory_item.get("measurement", {})
-                        weight_data = measurement.get("weight", {})
-
-                        variant_data = {
-                            "id": item_id.split("/")[-1],
-                            "title": item.get("title"),
-                            "price": item.get("price"),
-                            "sku": item.get("sku"),
-                            "position": item.get("position"),
-                            "inventoryPolicy": item.get("inventoryPolicy"),
-                            "compareAtPrice": item.get("compareAtPrice"),
-                            "createdAt": item.get("createdAt"),
-                            "updatedAt": item.get("updatedAt"),
-                            "taxable": item.get("taxable"),
-                            "barcode": item.get("barcode"),
-                            "weight": weight_data.get("value"),
-                            "weightUnit": weight_data.get("unit"),
-                            "inventoryQuantity": item.get("inventoryQuantity"),
-                        }
-
-                        selected_options = item.get("selectedOptions", [])
-                        for i, opt in enumerate(selected_options[:3], 1):
-                            variant_data[f"option{i}"] = opt.get("value")
-
-                        if inventory_item:
-                            variant_data["inventoryItemId"] = (
-                                inventory_item.get("id", "").split("/")[-1]
-                            )
-                            variant_data["inventoryManagement"] = (
-                                "shopify" if inventory_item.get("tracked") else None
-                            )
-                            variant_data["requiresShipping"] = inventory_item.get(
-                                "requiresShipping"
-                            )
+    # ------------------------------------------------------------
+    # 6. Mark stage complete; attribution is its own sync stage
+    # ------------------------------------------------------------
+    await mark_sync_stage_complete(shop_id, "orders", total_orders)
+    logger.info(f"✅ Orders synced: {total_orders} ({errors} failed)")
+    return total_orders
 
-                        products_map[parent_id]["variants"].append(variant_data)
-            except Exception as e:
-                print(f"Error parsing product line: {e}")
-                continue
 
-        total_products = 0
-        total_variants = 0
-        errors = 0
+async def sync_order_attribution(shop: str, shop_id: int, access_token: str):
+    """
+    Backfill first-visit attribution for the shop's orders via REST
+    (GET /orders/<id>/customer_journey.json), paced at ~2 orders/s.
 
+    Best effort: it may still be running after the initial sync has been
+    reported complete, so errors are logged rather than failing the sync.
+    """
+    try:
         async with get_conn() as conn:
             async with conn.cursor() as cur:
-                for product_data in products_map.values():
-                    try:
-                        await process_product_webhook(cur, shop_id, product_data)
-                        total_products += 1
-                        total_variants += len(product_data["variants"])
-
-                        if total_products % 50 == 0:
-                            await conn.commit()
-                            print(f"📦 Processed {total_products} products, {total_variants} variants...")
-                            await update_sync_progress(shop_id, 'products', 'in_progress', total_products)
-                    except Exception as e:
-                        print(f"Error processing product {product_data.get('id')}: {e}")
-                        errors += 1
-                        continue
+                await cur.execute(
+                    "SELECT order_id FROM shopify.orders WHERE shop_id = %s",
+                    (shop_id,),
+                )
+                order_ids = [row[0] for row in await cur.fetchall()]
+    except Exception as e:
+        logger.error(f"Failed to load orders for attribution for {shop}: {e}")
+        return 0
 
-                await conn.commit()
+    attributed = await _backfill_order_attribution(
+        get_client(), shop, shop_id, access_token, order_ids
+    )
+    logger.info(f"🔗 Attribution found for {attributed}/{len(order_ids)} orders")
+    return attributed
 
-        # Mark products stage as complete
-        await mark_sync_stage_complete(shop_id, 'products', total_products)
-        print(f"✅ Product sync complete: {total_products} products, {total_variants} variants ({errors} errors)")
-        
-        return total_products
 
 
-async def sync_product_variants(shop: str, shop_id: int, access_token: str):
-    """
-    Fetch ALL product variants using Shopify Bulk Operations API (GraphQL).
+async def sync_products(shop: str, shop_id: int, access_token: str):
     """
-    print(f"🔄 Starting bulk product variants sync for {shop}")
-
-    from commerce_app.core.db import get_conn
-
-    bulk_query = """
-    {
-      productVariants {
-        edges {
-          node {
-            id
-            title
-            price
-            sku
-            position
-            inventoryPolicy
-            compareAtPrice
-            createdAt
-            updatedAt
-            taxable
-            barcode
-            selectedOptions {
-              name
-              value
-            }
-            inventoryItem {
-              id
-              tracked
-              requiresShipping
-              measurement {
-                weight {
-                  unit
-                  value
-                }
-              }
-            }
-            inventoryQuantity
-            product {
-              id
-            }
-          }
-        }
-      }
-    }
+    Fetch ALL products and variants using Shopify Bulk Operations API (GraphQL).
     """
+    logger.info(f"🔄 Starting bulk product sync for {shop}")
 
-    escaped_query = (
-        bulk_query.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
-    )
-
-    mutation = f'''
-    mutation {{
-      bulkOperationRunQuery(query: "{escaped_query}") {{
-        bulkOperation {{ id status }}
-        userErrors {{ field message }}
-      }}
-    }}
-    '''
+    # Mark products sync as in progress
+    await update_sync_progress(shop_id, 'products', 0)
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            response = await client.post(
-                f"https://{shop}/admin/api/2025-10/graphql.json",
-                headers={
-                    "X-Shopify-Access-Token": access_token,
-                    "Content-Type": "application/json",
-                },
-                json={"query": mutation},
-            )
 
-            if response.status_code != 200:
-                print(f"Failed to start variant bulk operation: {response.text}")
-                return
+    client = get_client()
+    try:
+        response = await client.post(
+            f"https://{shop}/admin/api/2025-10/graphql.json",
+            headers={
+                "X-Shopify-Access-Token": access_token,
+                "Content-Type": "application/json",
+            },
+            content=_PRODUCTS_BULK_BODY,
+        )
 
-            data = response.json()
+        if response.status_code != 200:
+            logger.error(f"Failed to start product bulk operation: {response.text}")
+            await mark_sync_failed(shop_id, "Failed to start bulk operation", "products")
+            return None
 
-            if (
-                "errors" in data
-                or data.get("data", {})
-                .get("bulkOperationRunQuery", {})
-                .get("userErrors")
-            ):
-                print(f"GraphQL errors: {data}")
-                return
+        data = response.json()
 
-            operation_id = data["data"]["bulkOperationRunQuery"]["bulkOperation"]["id"]
-            print(f"✅ Started variant bulk operation: {operation_id}")
+        if (
+            "errors" in data
+            or data.get("data", {})
+            .get("bulkOperationRunQuery", {})
+            .get("userErrors")
+        ):
+            logger.error(f"GraphQL errors: {data}")
+            await mark_sync_failed(shop_id, "GraphQL errors", "products")
+            return None
 
-        except Exception as e:
-            print(f"Error starting variant bulk operation: {e}")
-            return
+        operation_id = data["data"]["bulkOperationRunQuery"]["bulkOperation"]["id"]
+        logger.info(f"✅ Started product bulk operation: {operation_id}")
 
-        status_query = """
-        query {
-          node(id: "%s") {
-            ... on BulkOperation {
-              id
-              status
-              errorCode
-              objectCount
-              url
-              partialDataUrl
-            }
-          }
-        }
-        """ % operation_id
+    except Exception as e:
+        logger.error(f"Error starting product bulk operation: {e}")
+        await mark_sync_failed(shop_id, str(e), "products")
+        return None
 
-        jsonl_url = None
-        max_wait = 600
-        start_time = asyncio.get_event_loop().time()
+    # Poll for completion
+    status, jsonl_url = await poll_bulk_operation(
+        client, shop, access_token, operation_id
+    )
+    if status is None:
+        logger.error("Product bulk operation timed out")
+        await mark_sync_failed(shop_id, "Timeout", "products")
+        return None
+    if status == "COMPLETED":
+        logger.info("✅ Product bulk operation completed")
+    else:
+        logger.error(f"Product sync failed: {status}")
+
+    if not jsonl_url:
+        logger.error("No product data URL")
+        await mark_sync_failed(shop_id, "No data URL", "products")
+        return None
+
+    # Stream, reshape and upsert in one pass. Bulk output lists each
+    # product right before its variants, so a product is complete as soon
+    # as the next one starts and only the current batch is held in memory.
+    logger.info("📥 Downloading product data...")
+    parse_errors = Counter()
+    total_products = 0
+    total_variants = 0
+    errors = 0
+
+    batch = []
+    batch_size = 500
+    current_product = None
+    committed = 0
+    last_progress = time.monotonic()
 
-        while True:
-            if asyncio.get_event_loop().time() - start_time > max_wait:
-                print("Variant bulk operation timed out")
-                return
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
 
-            await asyncio.sleep(2)
+            async def flush_batch():
+                nonlocal total_products, total_variants, errors, committed, last_progress
+                # Only the batch itself runs under the savepoint; commit and
+                # progress errors must not roll back to a released savepoint
+                try:
+                    await cur.execute("SAVEPOINT products_batch")
+                    batch_variants = await upsert_products(cur, shop_id, batch)
+                    await cur.execute("RELEASE SAVEPOINT products_batch")
+                except Exception as e:
+                    logger.error(f"Error processing products {total_products + errors}-{total_products + errors + len(batch)}: {e}")
+                    await cur.execute("ROLLBACK TO SAVEPOINT products_batch")
+                    errors += len(batch)
+                    batch.clear()
+                    return
+                total_products += len(batch)
+                total_variants += batch_variants
+                batch.clear()
+                if total_products - committed >= _COMMIT_EVERY:
+                    await conn.commit()
+                    committed = total_products
+                logger.info(f"📦 Processed {total_products} products, {total_variants} variants...")
+                now = time.monotonic()
+                if now - last_progress >= _PROGRESS_INTERVAL:
+                    last_progress = now
+                    await update_sync_progress(shop_id, 'products', total_products)
 
             try:
-                response = await client.post(
-                    f"https://{shop}/admin/api/2025-10/graphql.json",
-                    headers={
-                        "X-Shopify-Access-Token": access_token,
-                        "Content-Type": "application/json",
-                    },
-                    json={"query": status_query},
-                )
+                async with client.stream("GET", jsonl_url, timeout=120.0) as response:
+                    if response.status_code != 200:
+                        logger.error(f"Failed to download product data: {response.status_code}")
+                        await mark_sync_failed(shop_id, "Download failed", "products")
+                        return None
+
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
 
-                if response.status_code != 200:
-                    continue
+                        try:
+                            item = orjson.loads(line)
+                            item_id = item.get("id", "")
+
+                            if item_id.startswith(_PRODUCT_GID):
+                                if current_product is not None:
+                                    batch.append(current_product)
+                                    if len(batch) >= batch_size:
+                                        await flush_batch()
+                                current_product = {
+                                    "id": item_id[len(_PRODUCT_GID):],
+                                    "title": item.get("title"),
+                                    "handle": item.get("handle"),
+                                    "vendor": item.get("vendor"),
+                                    "productType": item.get("productType"),
+                                    "tags": item.get("tags"),
+                                    "status": item.get("status"),
+                                    "createdAt": item.get("createdAt"),
+                                    "updatedAt": item.get("updatedAt"),
+                                    "variants": [],
+                                }
+                            elif item_id.startswith(_VARIANT_GID):
+                                parent_id = _gid_id(item.get("__parentId"))
+                                if current_product is not None and parent_id == current_product["id"]:
+                                    inventory_item = item.get("inventoryItem") or _EMPTY
+                                    weight_data = (
+                                        (inventory_item.get("measurement") or _EMPTY).get("weight")
+                                        or _EMPTY
+                                    )
 
-                data = response.json()
-                operation = data.get("data", {}).get("node", {})
-                status = operation.get("status")
+                                    variant_data = {
+                                        "id": item_id[len(_VARIANT_GID):],
+                                        "title": item.get("title"),
+                                        "price": item.get("price"),
+                                        "sku": item.get("sku"),
+                                        "position": item.get("position"),
+                                        "inventoryPolicy": item.get("inventoryPolicy"),
+                                        "compareAtPrice": item.get("compareAtPrice"),
+                                        "createdAt": item.get("createdAt"),
+                                        "updatedAt": item.get("updatedAt"),
+                                        "taxable": item.get("taxable"),
+                                        "barcode": item.get("barcode"),
+                                        "weight": weight_data.get("value"),
+                                        "weightUnit": weight_data.get("unit"),
+                                        "inventoryQuantity": item.get("inventoryQuantity"),
+                                    }
+
+                                    selected_options = item.get("selectedOptions", [])
+                                    for i, opt in enumerate(selected_options[:3], 1):
+                                        variant_data[f"option{i}"] = opt.get("value")
+
+                                    if inventory_item:
+                                        variant_data["inventoryItemId"] = _gid_id(
+                                            inventory_item.get("id")
+                                        )
+                                        variant_data["inventoryManagement"] = (
+                                            "shopify" if inventory_item.get("tracked") else None
+                                        )
+                                        variant_data["requiresShipping"] = inventory_item.get(
+                                            "requiresShipping"
+                                        )
+
+                                    current_product["variants"].append(variant_data)
+                        except Exception as e:
+                            parse_errors[type(e).__name__] += 1
+                            continue
 
-                print(f"📊 Variant sync status: {status} ({operation.get('objectCount', 0)} objects)")
+            except Exception as e:
+                logger.error(f"Error downloading product data: {e}")
+                await mark_sync_failed(shop_id, str(e), "products")
+                return None
+
+            if current_product is not None:
+                batch.append(current_product)
+            if batch:
+                await flush_batch()
+            await conn.commit()
+
+    if parse_errors:
+        logger.warning(f"⚠️  Skipped unparseable product lines: {dict(parse_errors)}")
+
+    # Mark products stage as complete
+    await mark_sync_stage_complete(shop_id, 'products', total_products)
+    logger.info(f"✅ Product sync complete: {total_products} products, {total_variants} variants ({errors} errors)")
+    
+    return total_products
 
-                if status == "COMPLETED":
-                    jsonl_url = operation.get("url")
-                    print("✅ Variant bulk operation completed")
-                    break
-                elif status in ["FAILED", "CANCELED", "EXPIRED"]:
-                    print(f"Variant sync failed: {status}")
-                    jsonl_url = operation.get("partialDataUrl")
-                    break
 
-            except Exception as e:
-                print(f"Error polling variant bulk operation: {e}")
-                continue
+async def sync_product_variants(shop: str, shop_id: int, access_token: str):
+    """
+    Fetch ALL product variants using Shopify Bulk Operations API (GraphQL).
+    """
+    logger.info(f"🔄 Starting bulk product variants sync for {shop}")
 
-        if not jsonl_url:
-            print("No variant data URL")
-            return
+    client = get_client()
+    try:
+        response = await client.post(
+            f"https://{shop}/admin/api/2025-10/graphql.json",
+            headers={
+                "X-Shopify-Access-Token": access_token,
+                "Content-Type": "application/json",
+            },
+            content=_VARIANTS_BULK_BODY,
+        )
 
-        print("📥 Downloading variant data...")
-        try:
-            response = await client.get(jsonl_url, timeout=120.0)
+        if response.status_code != 200:
+            logger.error(f"Failed to start variant bulk operation: {response.text}")
+            return
 
-            if response.status_code != 200:
-                print(f"Failed to download variant data: {response.status_code}")
-                return
+        data = response.json()
 
-        except Exception as e:
-            print(f"Error downloading variant data: {e}")
+        if (
+            "errors" in data
+            or data.get("data", {})
+            .get("bulkOperationRunQuery", {})
+            .get("userErrors")
+        ):
+            logger.error(f"GraphQL errors: {data}")
             return
 
-        lines = response.text.strip().split("\n")
-        total_variants = 0
-        errors = 0
+        operation_id = data["data"]["bulkOperationRunQuery"]["bulkOperation"]["id"]
+        logger.info(f"✅ Started variant bulk operation: {operation_id}")
 
-        async with get_conn() as conn:
-            async with conn.cursor() as cur:
-                for line in lines:
-                    if not line.strip():
-                        continue
+    except Exception as e:
+        logger.error(f"Error starting variant bulk operation: {e}")
+        return
 
-                    try:
-                        variant = json.loads(line)
-                        variant_id = variant.get("id", "").split("/")[-1]
-                        product_id = (
-                            variant.get("product", {}).get("id", "").split("/")[-1]
-                        )
+    status, jsonl_url = await poll_bulk_operation(
+        client, shop, access_token, operation_id
+    )
+    if status is None:
+        logger.error("Variant bulk operation timed out")
+        return
+    if status == "COMPLETED":
+        logger.info("✅ Variant bulk operation completed")
+    else:
+        logger.error(f"Variant sync failed: {status}")
+
+    if not jsonl_url:
+        logger.error("No variant data URL")
+        return
+
+    logger.info("📥 Downloading variant data...")
+    total_variants = 0
+    errors = 0
+    parse_errors = Counter()
+    rows = []
+    batch_size = 5000
 
-                        selected_options = variant.get("selectedOptions", [])
-                        option1 = (
-                            selected_options[0].get("value")
-                            if len(selected_options) > 0
-                            else None
-                        )
-                        option2 = (
-                            selected_options[1].get("value")
-                            if len(selected_options) > 1
-                            else None
-                        )
-                        option3 = (
-                            selected_options[2].get("value")
-                            if len(selected_options) > 2
-                            else None
-                        )
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
+            try:
+                async with client.stream("GET", jsonl_url, timeout=120.0) as response:
+                    if response.status_code != 200:
+                        logger.error(f"Failed to download variant data: {response.status_code}")
+                        return
 
-                        inventory_item = variant.get("inventoryItem", {})
-                        measurement = inventory_item.get("measurement", {})
-                        weight_data = measurement.get("weight", {})
-                        weight = weight_data.get("value")
-                        weight_unit = weight_data.get("unit")
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
 
-                        inventory_item_id = (
-                            inventory_item.get("id", "").split("/")[-1]
-                            if inventory_item
-                            else None
-                        )
-                        inventory_management = (
-                            "shopify" if inventory_item.get("tracked") else None
-                        )
-                        requires_shipping = inventory_item.get("requiresShipping")
-
-                        await cur.execute(
-                            """
-                            INSERT INTO shopify.product_variants (
-                                shop_id, variant_id, product_id, title, price, sku, 
-                                position, inventory_policy, compare_at_price, 
-                                option1, option2, option3, created_at, updated_at, 
-                                taxable, barcode, weight, weight_unit, 
-                                inventory_item_id, inventory_quantity, 
-                                inventory_management, requires_shipping
-                            ) VALUES (
-                                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 
-                                %s, %s, %s, %s, %s, %s, %s, %s
+                        try:
+                            variant = orjson.loads(line)
+                            variant_id = _gid_id(variant.get("id"))
+                            product_id = _gid_id((variant.get("product") or _EMPTY).get("id"))
+
+                            options = [
+                                opt.get("value")
+                                for opt in (variant.get("selectedOptions") or ())[:3]
+                            ]
+                            option1, option2, option3 = options + [None] * (3 - len(options))
+
+                            inventory_item = variant.get("inventoryItem") or _EMPTY
+                            weight_data = (
+                                (inventory_item.get("measurement") or _EMPTY).get("weight")
+                                or _EMPTY
+                            )
+                            weight = weight_data.get("value")
+                            weight_unit = weight_data.get("unit")
+
+                            inventory_item_id = (
+                                _gid_id(inventory_item.get("id"))
+                                if inventory_item
+                                else None
                             )
-                            ON CONFLICT (shop_id, variant_id) 
-                            DO UPDATE SET
-                                title = EXCLUDED.title,
-                                price = EXCLUDED.price,
-                                sku = EXCLUDED.sku,
-                                position = EXCLUDED.position,
-                                inventory_policy = EXCLUDED.inventory_policy,
-                                compare_at_price = EXCLUDED.compare_at_price,
-                                option1 = EXCLUDED.option1,
-                                option2 = EXCLUDED.option2,
-                                option3 = EXCLUDED.option3,
-                                updated_at = EXCLUDED.updated_at,
-                                taxable = EXCLUDED.taxable,
-                                barcode = EXCLUDED.barcode,
-                                weight = EXCLUDED.weight,
-                                weight_unit = EXCLUDED.weight_unit,
-                                inventory_item_id = EXCLUDED.inventory_item_id,
-                                inventory_quantity = EXCLUDED.inventory_quantity,
-                                inventory_management = EXCLUDED.inventory_management,
-                                requires_shipping = EXCLUDED.requires_shipping
-                            """,
-                            (
+                            inventory_management = (
+                                "shopify" if inventory_item.get("tracked") else None
+                            )
+                            requires_shipping = inventory_item.get("requiresShipping")
+
+                            rows.append((
                                 shop_id,
                                 variant_id,
                                 product_id,
@@ -1072,140 +1463,162 @@ async def sync_product_variants(shop: str, shop_id: int, access_token: str):
                                 variant.get("inventoryQuantity"),
                                 inventory_management,
                                 requires_shipping,
-                            ),
-                        )
+                            ))
 
-                        total_variants += 1
+                        except Exception as e:
+                            parse_errors[type(e).__name__] += 1
+                            errors += 1
+                            continue
 
-                        if total_variants % 100 == 0:
-                            await conn.commit()
-                            print(f"📦 Processed {total_variants} variants...")
+                        if len(rows) >= batch_size:
+                            try:
+                                await cur.executemany(_SYNC_VARIANT_SQL, rows)
+                                await conn.commit()
+                                total_variants += len(rows)
+                                logger.info(f"📦 Processed {total_variants} variants...")
+                            except Exception as e:
+                                logger.error(f"Error processing variant batch: {e}")
+                                await conn.rollback()
+                                errors += len(rows)
+                            rows.clear()
 
-                    except Exception as e:
-                        print(f"Error processing variant: {e}")
-                        errors += 1
-                        continue
+            except Exception as e:
+                logger.error(f"Error downloading variant data: {e}")
+                return
 
-                await conn.commit()
+            if rows:
+                try:
+                    await cur.executemany(_SYNC_VARIANT_SQL, rows)
+                    total_variants += len(rows)
+                except Exception as e:
+                    logger.error(f"Error processing variant batch: {e}")
+                    await conn.rollback()
+                    errors += len(rows)
+            await conn.commit()
 
-        print(f"✅ Variant sync complete: {total_variants} variants ({errors} errors)")
+    if parse_errors:
+        logger.warning(f"⚠️  Skipped unparseable variant lines: {dict(parse_errors)}")
+    logger.info(f"✅ Variant sync complete: {total_variants} variants ({errors} errors)")
 
 
 async def sync_customers(shop: str, shop_id: int, access_token: str):
     """
     Extract customers using Shopify REST API with cursor-based pagination.
     """
-    print(f"🔄 Starting customer extraction for {shop}")
-
-    from commerce_app.core.db import get_conn
+    logger.info(f"🔄 Starting customer extraction for {shop}")
 
     # Mark customers sync as in progress
-    await update_sync_progress(shop_id, 'customers', 'in_progress', 0)
+    await update_sync_progress(shop_id, 'customers', 0)
+
+    client = get_client()
+    total_customers = 0
+    write_error = None
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        total_customers = 0
+    # REST pages have to be fetched in order, but the next page can be in
+    # flight while the previous one is written; the queue bounds how far
+    # the fetcher runs ahead of the database
+    pages = asyncio.Queue(maxsize=2)
+
+    async def fetch_pages():
         page_info = None
-        
+        try:
+            while True:
+                params = {"limit": 250}
+                if page_info:
+                    params["page_info"] = page_info
+
+                await _rest_slot(shop)
+                response = await client.get(
+                    f"https://{shop}/admin/api/2025-10/customers.json",
+                    headers={"X-Shopify-Access-Token": access_token},
+                    params=params
+                )
+
+                if response.status_code != 200:
+                    logger.warning(f"⚠️  Customer API returned {response.status_code}: {response.text}")
+                    break
+
+                data = response.json()
+                customers = data.get("customers", [])
+
+                if not customers:
+                    logger.info("✅ No more customers to fetch")
+                    break
+
+                await pages.put(customers)
+
+                match = _PAGE_INFO_RE.search(response.headers.get("Link", ""))
+                page_info = match.group(2) if match else None
+                if not page_info:
+                    break
+
+        except Exception as e:
+            logger.exception(f"Error fetching customers: {e}")
+
+        await pages.put(None)
+
+    last_progress = time.monotonic()
+    fetcher = asyncio.create_task(fetch_pages())
+    try:
         async with get_conn() as conn:
             async with conn.cursor() as cur:
                 while True:
+                    customers = await pages.get()
+                    if customers is None:
+                        break
+
+                    rows = []
+                    for customer in customers:
+                        try:
+                            rows.append((
+                                shop_id,
+                                int(customer.get("id")),
+                                customer.get("email"),
+                                customer.get("first_name"),
+                                customer.get("last_name"),
+                                customer.get("accepts_marketing", False),
+                                customer.get("created_at"),
+                                customer.get("updated_at"),
+                                customer.get("phone"),
+                                0.0,
+                                int(customer.get("orders_count", 0)),
+                                customer.get("state", "disabled"),
+                                orjson.dumps(customer).decode(),
+                            ))
+                        except Exception as e:
+                            logger.error(f"Error processing customer {customer.get('id')}: {e}")
+                            continue
+
                     try:
-                        params = {"limit": 250}
-                        if page_info:
-                            params["page_info"] = page_info
-                        
-                        response = await client.get(
-                            f"https://{shop}/admin/api/2025-10/customers.json",
-                            headers={"X-Shopify-Access-Token": access_token},
-                            params=params
-                        )
-                        
-                        if response.status_code != 200:
-                            print(f"⚠️  Customer API returned {response.status_code}: {response.text}")
-                            break
-                        
-                        data = response.json()
-                        customers = data.get("customers", [])
-                        
-                        if not customers:
-                            print(f"✅ No more customers to fetch")
-                            break
-                        
-                        for customer in customers:
-                            try:
-                                customer_id = customer.get("id")
-                                
-                                await cur.execute(
-                                    """
-                                    INSERT INTO shopify.customers (
-                                        shop_id, customer_id, email, first_name, last_name,
-                                        accepts_marketing, created_at, updated_at, phone,
-                                        total_spent, orders_count, state, raw_json
-                                    ) VALUES (
-                                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                                    )
-                                    ON CONFLICT (shop_id, customer_id)
-                                    DO UPDATE SET
-                                        email = EXCLUDED.email,
-                                        first_name = EXCLUDED.first_name,
-                                        last_name = EXCLUDED.last_name,
-                                        accepts_marketing = EXCLUDED.accepts_marketing,
-                                        updated_at = EXCLUDED.updated_at,
-                                        phone = EXCLUDED.phone,
-                                        orders_count = EXCLUDED.orders_count,
-                                        state = EXCLUDED.state,
-                                        raw_json = EXCLUDED.raw_json
-                                    """,
-                                    (
-                                        shop_id,
-                                        int(customer_id),
-                                        customer.get("email"),
-                                        customer.get("first_name"),
-                                        customer.get("last_name"),
-                                        customer.get("accepts_marketing", False),
-                                        customer.get("created_at"),
-                                        customer.get("updated_at"),
-                                        customer.get("phone"),
-                                        0.0,
-                                        int(customer.get("orders_count", 0)),
-                                        customer.get("state", "disabled"),
-                                        json.dumps(customer),
-                                    ),
-                                )
-                                total_customers += 1
-                                
-                            except Exception as e:
-                                print(f"Error processing customer {customer.get('id')}: {e}")
-                                continue
-                        
+                        await cur.executemany(_SYNC_CUSTOMER_SQL, rows)
                         await conn.commit()
-                        print(f"👥 Processed {total_customers} customers...")
-                        
-                        # Update progress
-                        await update_sync_progress(shop_id, 'customers', 'in_progress', total_customers)
-                        
-                        link_header = response.headers.get("Link", "")
-                        if 'rel="next"' in link_header:
-                            import re
-                            match = re.search(r'page_info=([^>&]+)', link_header)
-                            if match:
-                                page_info = match.group(1)
-                            else:
-                                break
-                        else:
-                            break
-                        
-                        await asyncio.sleep(0.5)
-                        
                     except Exception as e:
-                        print(f"Error fetching customers: {e}")
-                        import traceback
-                        traceback.print_exc()
+                        logger.error(f"Error writing customers after {total_customers}: {e}")
+                        await conn.rollback()
+                        write_error = e
                         break
+                    total_customers += len(rows)
+
+                    logger.info(f"👥 Processed {total_customers} customers...")
+
+                    now = time.monotonic()
+                    if now - last_progress >= _PROGRESS_INTERVAL:
+                        last_progress = now
+                        await update_sync_progress(shop_id, 'customers', total_customers)
+    finally:
+        fetcher.cancel()
+        with suppress(asyncio.CancelledError):
+            await fetcher
+
+    if write_error is not None:
+        # None tells run_sequential_sync the stage failed, so it stops
+        # instead of marking the whole sync complete over this failure
+        await mark_sync_failed(shop_id, str(write_error), "customers")
+        return None
 
     # Mark customers stage as complete
     await mark_sync_stage_complete(shop_id, 'customers', total_customers)
-    print(f"✅ Customer extraction complete: {total_customers} customers imported")
+    logger.info(f"✅ Customer extraction complete: {total_customers} customers imported")
     
     return total_customers
 
@@ -1214,250 +1627,138 @@ async def sync_order_line_items(shop: str, shop_id: int, access_token: str):
     """
     Fetch ALL order line items using Shopify Bulk Operations API (GraphQL).
     """
-    print(f"🔄 Starting bulk order line items sync for {shop}")
-
-    from commerce_app.core.db import get_conn
+    logger.info(f"🔄 Starting bulk order line items sync for {shop}")
 
     # Mark line_items sync as in progress
-    await update_sync_progress(shop_id, 'line_items', 'in_progress', 0)
-
-    bulk_query = """
-    {
-      orders {
-        edges {
-          node {
-            id
-            name
-            lineItems {
-              edges {
-                node {
-                  id
-                  title
-                  quantity
-                  variantTitle
-                  name
-                  sku
-                  variant {
-                    id
-                  }
-                  product {
-                    id
-                  }
-                  originalUnitPriceSet {
-                    shopMoney {
-                      amount
-                      currencyCode
-                    }
-                  }
-                  discountedUnitPriceSet {
-                    shopMoney {
-                      amount
-                      currencyCode
-                    }
-                  }
-                  originalTotalSet {
-                    shopMoney {
-                      amount
-                    }
-                  }
-                  discountedTotalSet {
-                    shopMoney {
-                      amount
-                    }
-                  }
-                  taxable
-                  requiresShipping
-                  fulfillableQuantity
-                  fulfillmentStatus
-                }
-              }
-            }
-          }
-        }
-      }
-    }
-    """
-
-    escaped_query = (
-        bulk_query.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
-    )
-
-    mutation = f'''
-    mutation {{
-      bulkOperationRunQuery(query: "{escaped_query}") {{
-        bulkOperation {{ id status }}
-        userErrors {{ field message }}
-      }}
-    }}
-    '''
-
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            response = await client.post(
-                f"https://{shop}/admin/api/2025-10/graphql.json",
-                headers={
-                    "X-Shopify-Access-Token": access_token,
-                    "Content-Type": "application/json",
-                },
-                json={"query": mutation},
-            )
-
-            if response.status_code != 200:
-                print(f"Failed to start line items bulk operation: {response.text}")
-                await update_sync_progress(shop_id, 'line_items', 'failed', 0, "Failed to start bulk operation")
-                return 0
-
-            data = response.json()
-
-            if (
-                "errors" in data
-                or data.get("data", {})
-                .get("bulkOperationRunQuery", {})
-                .get("userErrors")
-            ):
-                print(f"GraphQL errors: {data}")
-                await update_sync_progress(shop_id, 'line_items', 'failed', 0, "GraphQL errors")
-                return 0
-
-            operation_id = data["data"]["bulkOperationRunQuery"]["bulkOperation"]["id"]
-            print(f"✅ Started line items bulk operation: {operation_id}")
-
-        except Exception as e:
-            print(f"Error starting line items bulk operation: {e}")
-            await update_sync_progress(shop_id, 'line_items', 'failed', 0, str(e))
-            return 0
-
-        status_query = """
-        query {
-          node(id: "%s") {
-            ... on BulkOperation {
-              id
-              status
-              errorCode
-              objectCount
-              url
-              partialDataUrl
-            }
-          }
-        }
-        """ % operation_id
-
-        jsonl_url = None
-        max_wait = 600
-        start_time = asyncio.get_event_loop().time()
+    await update_sync_progress(shop_id, 'line_items', 0)
 
-        while True:
-            if asyncio.get_event_loop().time() - start_time > max_wait:
-                print("Line items bulk operation timed out")
-                await update_sync_progress(shop_id, 'line_items', 'failed', 0, "Timeout")
-                return 0
-
-            await asyncio.sleep(2)
-
-            try:
-                response = await client.post(
-                    f"https://{shop}/admin/api/2025-10/graphql.json",
-                    headers={
-                        "X-Shopify-Access-Token": access_token,
-                        "Content-Type": "application/json",
-                    },
-                    json={"query": status_query},
-                )
-
-                if response.status_code != 200:
-                    continue
-
-                data = response.json()
-                operation = data.get("data", {}).get("node", {})
-                status = operation.get("status")
-
-                print(f"📊 Line items sync status: {status} ({operation.get('objectCount', 0)} objects)")
+    client = get_client()
+    try:
+        response = await client.post(
+            f"https://{shop}/admin/api/2025-10/graphql.json",
+            headers={
+                "X-Shopify-Access-Token": access_token,
+                "Content-Type": "application/json",
+            },
+            content=_LINE_ITEMS_BULK_BODY,
+        )
 
-                if status == "COMPLETED":
-                    jsonl_url = operation.get("url")
-                    print("✅ Line items bulk operation completed")
-                    break
-                elif status in ["FAILED", "CANCELED", "EXPIRED"]:
-                    print(f"Line items sync failed: {status}")
-                    jsonl_url = operation.get("partialDataUrl")
-                    break
+        if response.status_code != 200:
+            logger.error(f"Failed to start line items bulk operation: {response.text}")
+            await mark_sync_failed(shop_id, "Failed to start bulk operation", "line_items")
+            return None
 
-            except Exception as e:
-                print(f"Error polling line items bulk operation: {e}")
-                continue
+        data = response.json()
 
-        if not jsonl_url:
-            print("No line items data URL")
-            await update_sync_progress(shop_id, 'line_items', 'failed', 0, "No data URL")
-            return 0
+        if (
+            "errors" in data
+            or data.get("data", {})
+            .get("bulkOperationRunQuery", {})
+            .get("userErrors")
+        ):
+            logger.error(f"GraphQL errors: {data}")
+            await mark_sync_failed(shop_id, "GraphQL errors", "line_items")
+            return None
 
-        print("📥 Downloading line items data...")
-        try:
-            response = await client.get(jsonl_url, timeout=120.0)
+        operation_id = data["data"]["bulkOperationRunQuery"]["bulkOperation"]["id"]
+        logger.info(f"✅ Started line items bulk operation: {operation_id}")
 
-            if response.status_code != 200:
-                print(f"Failed to download line items data: {response.status_code}")
-                await update_sync_progress(shop_id, 'line_items', 'failed', 0, "Download failed")
-                return 0
+    except Exception as e:
+        logger.error(f"Error starting line items bulk operation: {e}")
+        await mark_sync_failed(shop_id, str(e), "line_items")
+        return None
 
-        except Exception as e:
-            print(f"Error downloading line items data: {e}")
-            await update_sync_progress(shop_id, 'line_items', 'failed', 0, str(e))
-            return 0
+    status, jsonl_url = await poll_bulk_operation(
+        client, shop, access_token, operation_id
+    )
+    if status is None:
+        logger.error("Line items bulk operation timed out")
+        await mark_sync_failed(shop_id, "Timeout", "line_items")
+        return None
+    if status == "COMPLETED":
+        logger.info("✅ Line items bulk operation completed")
+    else:
+        logger.error(f"Line items sync failed: {status}")
+
+    if not jsonl_url:
+        logger.error("No line items data URL")
+        await mark_sync_failed(shop_id, "No data URL", "line_items")
+        return None
+
+    # Bulk output lists each order right before its line items, so rows
+    # are numbered and written as they stream in; only a per-order line
+    # counter is kept in memory
+    logger.info("📥 Downloading line items data...")
+    line_counter = {}
+    total_line_items = 0
+    errors = 0
+    parse_errors = Counter()
+
+    records = []
+    batch_size = 5000
+    committed = 0
+    last_progress = time.monotonic()
 
-        lines = response.text.strip().split("\n")
-        orders_map = {}
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
 
-        for line in lines:
-            if not line.strip():
-                continue
+            async def flush_records():
+                nonlocal total_line_items, errors, committed, last_progress
+                # Only the batch itself runs under the savepoint; commit and
+                # progress errors must not roll back to a released savepoint
+                try:
+                    await cur.execute("SAVEPOINT line_items_batch")
+                    await cur.executemany(_SYNC_LINE_ITEM_SQL, records)
+                    await cur.execute("RELEASE SAVEPOINT line_items_batch")
+                except Exception as e:
+                    logger.error(f"Error processing line item batch: {e}")
+                    await cur.execute("ROLLBACK TO SAVEPOINT line_items_batch")
+                    errors += len(records)
+                    records.clear()
+                    return
+                total_line_items += len(records)
+                records.clear()
+                if total_line_items - committed >= _COMMIT_EVERY:
+                    await conn.commit()
+                    committed = total_line_items
+                logger.info(f"📦 Processed {total_line_items} line items...")
+                now = time.monotonic()
+                if now - last_progress >= _PROGRESS_INTERVAL:
+                    last_progress = now
+                    await update_sync_progress(shop_id, 'line_items', total_line_items)
 
             try:
-                item = json.loads(line)
-                item_id = item.get("id", "")
-
-                if "/Order/" in item_id:
-                    order_id = item_id.split("/")[-1]
-                    orders_map[order_id] = {
-                        "id": order_id,
-                        "name": item.get("name"),
-                        "line_items": [],
-                    }
-                elif "/LineItem/" in item_id:
-                    parent_id = item.get("__parentId", "").split("/")[-1]
-                    if parent_id in orders_map:
-                        orders_map[parent_id]["line_items"].append(item)
+                async with client.stream("GET", jsonl_url, timeout=120.0) as response:
+                    if response.status_code != 200:
+                        logger.error(f"Failed to download line items data: {response.status_code}")
+                        await mark_sync_failed(shop_id, "Download failed", "line_items")
+                        return None
+
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
 
-            except Exception as e:
-                print(f"Error parsing line item: {e}")
-                continue
+                        # A malformed item is skipped on its own instead
+                        # of aborting a database batch
+                        try:
+                            line_item = orjson.loads(line)
+                            item_id = line_item.get("id", "")
 
-        total_line_items = 0
-        errors = 0
+                            if item_id.startswith(_ORDER_GID):
+                                line_counter[item_id[len(_ORDER_GID):]] = 1
+                                continue
+                            if not item_id.startswith(_LINE_ITEM_GID):
+                                continue
 
-        async with get_conn() as conn:
-            async with conn.cursor() as cur:
-                for order_data in orders_map.values():
-                    order_id = order_data["id"]
-                    line_number = 1
+                            order_id = _gid_id(line_item.get("__parentId"))
+                            line_number = line_counter.get(order_id)
+                            if line_number is None:
+                                continue
 
-                    for line_item in order_data["line_items"]:
-                        try:
-                            line_item_id = line_item.get("id", "").split("/")[-1]
-                            variant_id = (
-                                line_item.get("variant", {})
-                                .get("id", "")
-                                .split("/")[-1]
-                                if line_item.get("variant")
-                                else None
-                            )
-                            product_id = (
-                                line_item.get("product", {})
-                                .get("id", "")
-                                .split("/")[-1]
-                                if line_item.get("product")
-                                else None
-                            )
+                            variant = line_item.get("variant")
+                            variant_id = _gid_id(variant.get("id")) if variant else None
+                            product = line_item.get("product")
+                            product_id = _gid_id(product.get("id")) if product else None
 
                             original_total = float(
                                 line_item.get("originalTotalSet", {})
@@ -1477,56 +1778,42 @@ async def sync_order_line_items(shop: str, shop_id: int, access_token: str):
                                 .get("amount")
                             )
 
-                            await cur.execute(
-                                """
-                                INSERT INTO shopify.order_line_items (
-                                    shop_id, order_id, line_number, product_id, variant_id,
-                                    title, quantity,
-                                    price, total_discount
-                                ) VALUES (
-                                    %s, %s, %s, %s, %s, %s, %s, %s, %s
-                                )
-                                ON CONFLICT (shop_id, order_id, line_number)
-                                DO UPDATE SET
-                                    product_id = EXCLUDED.product_id,
-                                    variant_id = EXCLUDED.variant_id,
-                                    title = EXCLUDED.title,
-                                    quantity = EXCLUDED.quantity,
-                                    price = EXCLUDED.price,
-                                    total_discount = EXCLUDED.total_discount
-                                """,
-                                (
-                                    shop_id,
-                                    int(order_id),
-                                    line_number,
-                                    int(product_id) if product_id else None,
-                                    int(variant_id) if variant_id else None,
-                                    line_item.get("title"),
-                                    int(line_item.get("quantity", 0)),
-                                    float(unit_price) if unit_price else 0.0,
-                                    float(total_discount),
-                                ),
-                            )
-
-                            line_number += 1
-                            total_line_items += 1
-
-                            if total_line_items % 100 == 0:
-                                await conn.commit()
-                                print(f"📦 Processed {total_line_items} line items...")
-                                await update_sync_progress(shop_id, 'line_items', 'in_progress', total_line_items)
+                            records.append((
+                                shop_id,
+                                int(order_id),
+                                line_number,
+                                int(product_id) if product_id else None,
+                                int(variant_id) if variant_id else None,
+                                line_item.get("title"),
+                                int(line_item.get("quantity", 0)),
+                                float(unit_price) if unit_price else 0.0,
+                                float(total_discount),
+                            ))
+                            line_counter[order_id] = line_number + 1
 
                         except Exception as e:
-                            print(f"Error processing line item: {e}")
+                            parse_errors[type(e).__name__] += 1
                             errors += 1
-                            await conn.rollback()
                             continue
 
-                await conn.commit()
+                        if len(records) >= batch_size:
+                            await flush_records()
+
+            except Exception as e:
+                logger.error(f"Error downloading line items data: {e}")
+                await mark_sync_failed(shop_id, str(e), "line_items")
+                return None
+
+            if records:
+                await flush_records()
+            await conn.commit()
+
+    if parse_errors:
+        logger.warning(f"⚠️  Skipped unparseable line items: {dict(parse_errors)}")
 
     # Mark line_items stage as complete
     await mark_sync_stage_complete(shop_id, 'line_items', total_line_items)
-    print(f"✅ Line items sync complete: {total_line_items} line items ({errors} errors)")
+    logger.info(f"✅ Line items sync complete: {total_line_items} line items ({errors} errors)")
     
     return total_line_items
 
@@ -1534,48 +1821,114 @@ async def sync_order_line_items(shop: str, shop_id: int, access_token: str):
 # ============================================================================
 # SEQUENTIAL SYNC FUNCTION - Runs syncs in order to avoid foreign key violations
 # ============================================================================
+# Stage -> stages it has to wait for. Orders need customers for the foreign
+# key and products to free the shop's single bulk-operation slot; line items
+# and the REST attribution backfill only need the order rows, so they run
+# side by side.
+_SYNC_STAGE_DEPS = {
+    "customers": (),
+    "products": (),
+    "orders": ("customers", "products"),
+    "line_items": ("orders",),
+    "attribution": ("orders",),
+}
+
+# Stages the initial sync reports on; the sync is shown as complete once
+# these finish, even while the attribution backfill is still running
+_TRACKED_STAGES = ("customers", "products", "orders", "line_items")
+
+
 async def run_sequential_sync(shop: str, shop_id: int, access_token: str):
     """
-    Run all sync operations SEQUENTIALLY to avoid foreign key violations.
-    
-    Order matters:
-    1. Customers first (no dependencies)
-    2. Products (no dependencies)
-    3. Orders (depends on customers existing)
-    4. Line items (depends on orders existing)
+    Run the sync stages in dependency order to avoid foreign key violations.
+
+    Stages are scheduled from _SYNC_STAGE_DEPS: each one starts as soon as
+    everything it depends on has finished, so customers (REST paging) and
+    products (bulk) run side by side, and line items and attribution start
+    the moment orders complete.
+
+    A stage returns its item count, or None once it has recorded its own
+    failure with mark_sync_failed; the remaining stages are then cancelled.
+    This function is the only writer of the shared current-stage columns.
     """
+    stages = {
+        "customers": sync_customers,
+        "products": sync_products,
+        "orders": initial_data_sync,
+        "line_items": sync_order_line_items,
+        "attribution": sync_order_attribution,
+    }
+    waiting = {stage: set(deps) for stage, deps in _SYNC_STAGE_DEPS.items()}
+    running = {}
+    counts = {}
+    current = None
+
+    async def stop_running():
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
     try:
-        # 1. Customers FIRST
-        print(f"🔄 [1/4] Starting customer sync for {shop}")
-        customers_count = await sync_customers(shop, shop_id, access_token)
-        print(f"✅ [1/4] Customer sync complete for {shop}: {customers_count} customers")
-        
-        # 2. Products
-        print(f"🔄 [2/4] Starting product sync for {shop}")
-        products_count = await sync_products(shop, shop_id, access_token)
-        print(f"✅ [2/4] Product sync complete for {shop}: {products_count} products")
-        
-        # 3. Orders
-        print(f"🔄 [3/4] Starting order sync for {shop}")
-        orders_count = await initial_data_sync(shop, shop_id, access_token)
-        print(f"✅ [3/4] Order sync complete for {shop}: {orders_count} orders")
-        
-        # 4. Line items
-        print(f"🔄 [4/4] Starting line items sync for {shop}")
-        line_items_count = await sync_order_line_items(shop, shop_id, access_token)
-        print(f"✅ [4/4] Line items sync complete for {shop}: {line_items_count} line items")
-        
-        # Mark full sync as complete
-        await mark_full_sync_complete(shop_id)
-        
-        print(f"🎉 All syncs completed successfully for {shop}")
-        print(f"   📊 Summary: {customers_count} customers, {products_count} products, {orders_count} orders, {line_items_count} line items")
-        
+        while waiting or running:
+            for stage in [stage for stage, deps in waiting.items() if not deps]:
+                del waiting[stage]
+                logger.info(f"🔄 Starting {stage} sync for {shop}")
+                task = asyncio.create_task(stages[stage](shop, shop_id, access_token))
+                running[task] = stage
+
+            # Report the earliest tracked stage still running
+            active = set(running.values())
+            stage = next((s for s in _TRACKED_STAGES if s in active), None)
+            if stage and stage != current:
+                current = stage
+                await set_current_stage(shop_id, stage)
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                stage = running.pop(task)
+                result = task.result()
+                if result is None:
+                    logger.error(f"❌ {stage} sync failed for {shop}, stopping remaining stages")
+                    await stop_running()
+                    return
+                counts[stage] = result
+                logger.info(f"✅ {stage} sync complete for {shop}: {counts[stage]}")
+                for deps in waiting.values():
+                    deps.discard(stage)
+
+                if stage in _TRACKED_STAGES and all(s in counts for s in _TRACKED_STAGES):
+                    await mark_full_sync_complete(shop_id)
+                    logger.info(
+                        f"🎉 All syncs completed successfully for {shop}: "
+                        f"{counts['customers']} customers, {counts['products']} products, "
+                        f"{counts['orders']} orders, {counts['line_items']} line items"
+                    )
+
     except Exception as e:
-        print(f"❌ Error during sequential sync for {shop}: {e}")
-        import traceback
-        traceback.print_exc()
-        await mark_sync_failed(shop_id, str(e))
+        await stop_running()
+        logger.exception(f"❌ Error during sequential sync for {shop}: {e}")
+        await mark_sync_failed(shop_id, str(e), current)
+
+
+async def _fetch_shop_name(client: httpx.AsyncClient, shop: str, access_token: str) -> str:
+    """Shop display name from shop.json, or "" if it cannot be fetched."""
+    try:
+        await _rest_slot(shop)
+        r = await client.get(
+            f"https://{shop}/admin/api/2025-10/shop.json",
+            headers={"X-Shopify-Access-Token": access_token},
+            timeout=20.0,
+        )
+    except httpx.HTTPError as e:
+        logger.warning(f"⚠️  shop.json fetch failed for {shop}: {e}")
+        return ""
+    if r.status_code != 200:
+        return ""
+    try:
+        return r.json()["shop"].get("name") or ""
+    except (ValueError, KeyError, AttributeError) as e:
+        logger.warning(f"⚠️  Unexpected shop.json body for {shop}: {e}")
+        return ""
 
 
 # ============================================================================
@@ -1589,15 +1942,7 @@ async def auth_check(shop: str):
     if not is_valid_shop(shop):
         raise HTTPException(status_code=400, detail="Invalid shop parameter")
 
-    conn = db()
-    with conn, conn.cursor() as cur:
-        cur.execute(
-            "SELECT access_token FROM shopify.shops WHERE shop_domain = %s",
-            (shop,),
-        )
-        row = cur.fetchone()
-
-    if row and row.get("access_token"):
+    if await get_shop_creds(shop):
         return {"ok": True}
 
     raise HTTPException(status_code=401, detail="No access token for shop")
@@ -1608,28 +1953,16 @@ async def auth_start(request: Request, shop: str, host: Optional[str] = None):
     if not is_valid_shop(shop):
         raise HTTPException(status_code=400, detail="Invalid shop parameter")
 
-    state = base64.urlsafe_b64encode(os.urandom(16)).decode().rstrip("=")
+    state = secrets.token_urlsafe(16)
 
     if host:
-        html = f"""
-        <!doctype html><html><head><script>
-        window.top.location.href = "{APP_URL}/auth/top?shop={shop}&state={state}";
-        </script></head><body></body></html>"""
+        html = _BOUNCE_PREFIX + shop.encode() + _BOUNCE_MID + state.encode() + _BOUNCE_SUFFIX
         resp = HTMLResponse(content=html)
         set_cookie(resp, "oauth_state", state)
-        if host:
-            set_cookie(resp, "shopify_host", host)
+        set_cookie(resp, "shopify_host", host)
         return resp
 
-    permission_url = (
-        f"https://{shop}/admin/oauth/authorize"
-        f"?client_id={SHOPIFY_API_KEY}"
-        f"&scope={urlparse.quote(SCOPES)}"
-        f"&redirect_uri={urlparse.quote(APP_URL + '/auth/callback')}"
-        f"&state={state}"
-    )
-    if GRANT_PER_USER:
-        permission_url += "&grant_options[]=per-user"
+    permission_url = _PERM_TMPL.format(shop=shop, state=state)
 
     resp = RedirectResponse(permission_url, status_code=302)
     set_cookie(resp, "oauth_state", state)
@@ -1642,15 +1975,7 @@ async def auth_start(request: Request, shop: str, host: Optional[str] = None):
 async def top_level_bounce(request: Request, shop: str, state: str):
     if not is_valid_shop(shop):
         raise HTTPException(status_code=400, detail="Invalid shop")
-    permission_url = (
-        f"https://{shop}/admin/oauth/authorize"
-        f"?client_id={SHOPIFY_API_KEY}"
-        f"&scope={urlparse.quote(SCOPES)}"
-        f"&redirect_uri={urlparse.quote(APP_URL + '/auth/callback')}"
-        f"&state={state}"
-    )
-    if GRANT_PER_USER:
-        permission_url += "&grant_options[]=per-user"
+    permission_url = _PERM_TMPL.format(shop=shop, state=state)
     resp = RedirectResponse(permission_url)
     set_cookie(resp, "oauth_state", state)
     return resp
@@ -1658,14 +1983,14 @@ async def top_level_bounce(request: Request, shop: str, state: str):
 
 @router.get("/callback")
 async def auth_callback(request: Request, background_tasks: BackgroundTasks):
-    qp = dict(request.query_params)
-    hmac_ok = verify_hmac(SHOPIFY_API_SECRET, qp)
+    params = request.query_params
+    hmac_ok = verify_hmac(_SECRET_BYTES, params.multi_items())
     if not hmac_ok:
         raise HTTPException(status_code=400, detail="HMAC verification failed")
 
-    shop = qp.get("shop")
-    code = qp.get("code")
-    state = qp.get("state")
+    shop = params.get("shop")
+    code = params.get("code")
+    state = params.get("state")
     if not (shop and code and state):
         raise HTTPException(status_code=400, detail="Missing shop/code/state")
 
@@ -1673,39 +1998,40 @@ async def auth_callback(request: Request, background_tasks: BackgroundTasks):
     if not cookie_state or cookie_state != state:
         raise HTTPException(status_code=400, detail="State mismatch")
 
-    conn = db()
-    with conn, conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT shop_id, access_token, updated_at 
-            FROM shopify.shops 
-            WHERE shop_domain = %s
-            """,
-            (shop,),
-        )
-        existing_shop = cur.fetchone()
-
-        if existing_shop and existing_shop["updated_at"]:
-            from datetime import datetime, timezone, timedelta
+    # Serialize duplicate callbacks for the same shop; the recent-install
+    # check below then short-circuits the second one once the first commits
+    async with _shop_lock(shop):
+        async with get_conn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    """
+                    SELECT updated_at, webhooks_hash,
+                           webhooks_registered_at > now() - %s::interval
+                    FROM shopify.shops
+                    WHERE shop_domain = %s
+                    """,
+                    (_WEBHOOK_TTL, shop),
+                    prepare=True,
+                )
+                existing_shop = await cur.fetchone()
 
-            if existing_shop["updated_at"] > datetime.now(
-                timezone.utc
-            ) - timedelta(seconds=30):
-                print(
+        if existing_shop and existing_shop[0]:
+            if existing_shop[0] > datetime.now(timezone.utc) - timedelta(seconds=30):
+                logger.info(
                     f"⚠️  Shop {shop} already installed recently, skipping duplicate callback"
                 )
-                redirect_url = f"https://{shop}/admin/apps/{SHOPIFY_API_KEY}"
+                redirect_url = "https://" + shop + _ADMIN_APPS_SUFFIX
                 return RedirectResponse(url=redirect_url, status_code=302)
 
-    token_url = f"https://{shop}/admin/oauth/access_token"
-    payload = {
-        "client_id": SHOPIFY_API_KEY,
-        "client_secret": SHOPIFY_API_SECRET,
-        "code": code,
-    }
+        token_url = f"https://{shop}/admin/oauth/access_token"
+        payload = {
+            "client_id": SHOPIFY_API_KEY,
+            "client_secret": SHOPIFY_API_SECRET,
+            "code": code,
+        }
 
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        r = await client.post(token_url, json=payload)
+        client = get_client()
+        r = await client.post(token_url, json=payload, timeout=20.0)
         if r.status_code != 200:
             raise HTTPException(
                 status_code=400, detail=f"Token exchange failed: {r.text}"
@@ -1714,175 +2040,166 @@ async def auth_callback(request: Request, background_tasks: BackgroundTasks):
         access_token = data["access_token"]
         scope = data.get("scope", "")
 
-        print(f"🔍 REQUESTED SCOPES: {SCOPES}")
-        print(f"🔍 GRANTED SCOPES: {scope}")
-        print(f"🔍 TOKEN RESPONSE: {json.dumps(data, indent=2)}")
+        logger.info(f"🔍 Scopes for {shop}: requested {SCOPES}, granted {scope}")
 
-        shop_info_response = await client.get(
-            f"https://{shop}/admin/api/2025-10/shop.json",
-            headers={"X-Shopify-Access-Token": access_token},
+        # The shop name is only cosmetic; fetch it while the upsert runs
+        shop_name_task = asyncio.create_task(
+            _fetch_shop_name(client, shop, access_token)
         )
 
-        if shop_info_response.status_code == 200:
-            shop_data = shop_info_response.json()["shop"]
-            shop_name = shop_data.get("name", "")
-        else:
-            shop_name = ""
-
-    conn = db()
-    with conn, conn.cursor() as cur:
         try:
-            cur.execute(
-                """
-                INSERT INTO shopify.shops (
-                    shop_domain, 
-                    shop_name, 
-                    access_token, 
-                    access_scope, 
-                    installed_at, 
-                    updated_at,
-                    initial_sync_status,
-                    sync_current_stage,
-                    sync_stage_status,
-                    sync_customers_count,
-                    sync_products_count,
-                    sync_orders_count,
-                    sync_line_items_count,
-                    sync_customers_completed,
-                    sync_products_completed,
-                    sync_orders_completed,
-                    sync_line_items_completed
-                )
-                VALUES (%s, %s, %s, %s, now(), now(), 'pending', 'customers', 'pending', 0, 0, 0, 0, FALSE, FALSE, FALSE, FALSE)
-                ON CONFLICT (shop_domain)
-                DO UPDATE SET 
-                    shop_name = EXCLUDED.shop_name,
-                    access_token = EXCLUDED.access_token,
-                    access_scope = EXCLUDED.access_scope,
-                    updated_at = now(),
-                    initial_sync_status = 'pending',
-                    sync_current_stage = 'customers',
-                    sync_stage_status = 'pending',
-                    sync_customers_count = 0,
-                    sync_products_count = 0,
-                    sync_orders_count = 0,
-                    sync_line_items_count = 0,
-                    sync_customers_completed = FALSE,
-                    sync_products_completed = FALSE,
-                    sync_orders_completed = FALSE,
-                    sync_line_items_completed = FALSE,
-                    sync_error = NULL
-                RETURNING shop_id;
-                """,
-                (shop, shop_name, access_token, scope),
-            )
-            shop_id = cur.fetchone()["shop_id"]
-        except Exception as e:
-            print(f"⚠️  Insert failed, fetching existing shop: {e}")
-            conn.rollback()
-            cur.execute(
-                "SELECT shop_id FROM shopify.shops WHERE shop_domain = %s",
-                (shop,),
+            async with get_conn() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        """
+                        INSERT INTO shopify.shops (
+                            shop_domain, 
+                            shop_name, 
+                            access_token, 
+                            access_scope, 
+                            installed_at, 
+                            updated_at,
+                            initial_sync_status,
+                            sync_current_stage,
+                            sync_stage_status,
+                            sync_customers_count,
+                            sync_products_count,
+                            sync_orders_count,
+                            sync_line_items_count,
+                            sync_customers_completed,
+                            sync_products_completed,
+                            sync_orders_completed,
+                            sync_line_items_completed
+                        )
+                        VALUES (%s, '', %s, %s, now(), now(), 'pending', 'customers', 'pending', 0, 0, 0, 0, FALSE, FALSE, FALSE, FALSE)
+                        ON CONFLICT (shop_domain)
+                        DO UPDATE SET 
+                            access_token = EXCLUDED.access_token,
+                            access_scope = EXCLUDED.access_scope,
+                            updated_at = now(),
+                            initial_sync_status = 'pending',
+                            sync_current_stage = 'customers',
+                            sync_stage_status = 'pending',
+                            sync_customers_count = 0,
+                            sync_products_count = 0,
+                            sync_orders_count = 0,
+                            sync_line_items_count = 0,
+                            sync_customers_completed = FALSE,
+                            sync_products_completed = FALSE,
+                            sync_orders_completed = FALSE,
+                            sync_line_items_completed = FALSE,
+                            sync_error = NULL
+                        WHERE shopify.shops.updated_at IS NULL
+                           OR shopify.shops.updated_at < now() - interval '30 seconds'
+                        RETURNING shop_id;
+                        """,
+                        (shop, access_token, scope),
+                        prepare=True,
+                    )
+                    row = await cur.fetchone()
+                await conn.commit()
+        except Exception:
+            shop_name_task.cancel()
+            raise
+
+        if row is None:
+            # A concurrent callback (e.g. on another worker) reinstalled
+            # the shop after our recent-install check; let it finish
+            shop_name_task.cancel()
+            logger.info(
+                f"⚠️  Shop {shop} reinstalled concurrently, skipping duplicate callback"
             )
-            result = cur.fetchone()
-            shop_id = result["shop_id"] if result else None
-            if not shop_id:
-                raise HTTPException(status_code=500, detail="Failed to save shop")
+            redirect_url = "https://" + shop + _ADMIN_APPS_SUFFIX
+            return RedirectResponse(url=redirect_url, status_code=302)
+        shop_id = row[0]
+        _shop_cache.pop(shop, None)
+
+        # Awaited after the upsert's connection is back in the pool, so a
+        # slow shop.json never holds a pool slot
+        shop_name = await shop_name_task
+        if shop_name:
+            try:
+                async with get_conn() as conn:
+                    await conn.execute(
+                        "UPDATE shopify.shops SET shop_name = %s WHERE shop_id = %s",
+                        (shop_name, shop_id),
+                    )
+                    await conn.commit()
+            except Exception as e:
+                logger.warning(f"⚠️  Failed to store shop name for {shop}: {e}")
 
     try:
-        await register_webhooks(shop, access_token)
-        print(f"✅ Webhooks registered for {shop}")
+        # Same token and topic set registered recently: subscriptions are live
+        if (
+            existing_shop
+            and existing_shop[2]
+            and existing_shop[1] == _webhooks_hash(access_token)
+        ):
+            logger.info(f"⏭️  Webhooks already registered for {shop}, skipping")
+        else:
+            # Registration is not needed for the redirect; run it after the response
+            background_tasks.add_task(register_webhooks, shop, access_token)
+            logger.info(f"📋 Webhook registration queued for {shop}")
 
         background_tasks.add_task(run_sequential_sync, shop, shop_id, access_token)
-        print(f"📋 Sequential bulk sync queued for {shop} (customers→products→orders→line_items)")
+        logger.info(f"📋 Sync queued for {shop}")
 
     except Exception as e:
-        print(f"❌ Failed setup for {shop}: {e}")
+        logger.exception(f"❌ Failed setup for {shop}: {e}")
 
-    redirect_url = f"https://{shop}/admin/apps/{SHOPIFY_API_KEY}"
+    redirect_url = "https://" + shop + _ADMIN_APPS_SUFFIX
     return RedirectResponse(url=redirect_url, status_code=302)
 
 
+# Columns are aliased to the response keys; progress counts 0.5 for the
+# stage currently running
+_SYNC_STATUS_SQL = """
+    SELECT
+        initial_sync_status AS status,
+        initial_sync_completed_at AS completed_at,
+        COALESCE(NULLIF(initial_sync_error, ''), sync_error) AS error,
+        sync_current_stage AS current_stage,
+        sync_stage_status AS stage_status,
+        COALESCE(sync_customers_count, 0) AS customers_synced,
+        COALESCE(sync_products_count, 0) AS products_synced,
+        COALESCE(NULLIF(sync_orders_count, 0), initial_sync_order_count, 0) AS orders_synced,
+        COALESCE(sync_line_items_count, 0) AS line_items_synced,
+        COALESCE(sync_customers_completed, FALSE) AS customers_completed,
+        COALESCE(sync_products_completed, FALSE) AS products_completed,
+        COALESCE(sync_orders_completed, FALSE) AS orders_completed,
+        COALESCE(sync_line_items_completed, FALSE) AS line_items_completed,
+        (s.done + CASE WHEN sync_stage_status = 'in_progress' THEN 0.5 ELSE 0 END)
+            * 25.0::float8 AS progress_percent,
+        s.done AS stages_completed
+    FROM shopify.shops,
+    LATERAL (
+        SELECT COALESCE(sync_customers_completed, FALSE)::int
+             + COALESCE(sync_products_completed, FALSE)::int
+             + COALESCE(sync_orders_completed, FALSE)::int
+             + COALESCE(sync_line_items_completed, FALSE)::int AS done
+    ) s
+    WHERE shop_domain = %s
+    """
+
+
 @router.get("/sync-status/{shop_domain}")
 async def sync_status(shop_domain: str):
     """
     Check initial sync progress with detailed stage information.
     Returns current stage, counts for each stage, and completion status.
     """
-    from commerce_app.core.db import get_conn
-
     async with get_conn() as conn:
-        async with conn.cursor() as cur:
-            await cur.execute(
-                """SELECT 
-                    initial_sync_status,
-                    initial_sync_completed_at,
-                    initial_sync_error,
-                    sync_current_stage,
-                    sync_stage_status,
-                    sync_customers_count,
-                    sync_products_count,
-                    sync_orders_count,
-                    sync_line_items_count,
-                    sync_customers_completed,
-                    sync_products_completed,
-                    sync_orders_completed,
-                    sync_line_items_completed,
-                    sync_error,
-                    initial_sync_order_count
-                   FROM shopify.shops 
-                   WHERE shop_domain = %s""",
-                (shop_domain,),
-            )
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(_SYNC_STATUS_SQL, (shop_domain,), prepare=True)
             row = await cur.fetchone()
 
-            if not row:
-                return {"status": "not_found"}
-
-            # Calculate overall progress percentage
-            stages_completed = sum([
-                1 if row[9] else 0,   # sync_customers_completed
-                1 if row[10] else 0,  # sync_products_completed
-                1 if row[11] else 0,  # sync_orders_completed
-                1 if row[12] else 0,  # sync_line_items_completed
-            ])
-            
-            # If currently syncing, add partial progress for current stage
-            current_stage = row[3]
-            stage_status = row[4]
-            
-            if stage_status == 'in_progress':
-                # Add partial progress (0.5 for in-progress stage)
-                progress_percent = (stages_completed + 0.5) / 4 * 100
-            else:
-                progress_percent = stages_completed / 4 * 100
-
-            return {
-                "status": row[0],  # initial_sync_status
-                "completed_at": row[1].isoformat() if row[1] else None,
-                "error": row[2] or row[13],  # initial_sync_error or sync_error
-                
-                # Detailed stage information
-                "current_stage": current_stage,
-                "stage_status": stage_status,
-                
-                # Counts for each stage
-                "customers_synced": row[5] or 0,
-                "products_synced": row[6] or 0,
-                "orders_synced": row[7] or row[14] or 0,  # Also check initial_sync_order_count
-                "line_items_synced": row[8] or 0,
-                
-                # Completion flags
-                "customers_completed": row[9] or False,
-                "products_completed": row[10] or False,
-                "orders_completed": row[11] or False,
-                "line_items_completed": row[12] or False,
-                
-                # Overall progress
-                "progress_percent": progress_percent,
-                "stages_completed": stages_completed,
-                "total_stages": 4,
-            }
+    if not row:
+        return {"status": "not_found"}
+
+    if row["completed_at"]:
+        row["completed_at"] = row["completed_at"].isoformat()
+    row["total_stages"] = 4
+    return row
 
 
 # ============================================================================
@@ -1893,19 +2210,11 @@ async def trigger_customer_sync(
     shop_domain: str, background_tasks: BackgroundTasks
 ):
     """Manually trigger a customer sync for a shop."""
-    conn = db()
-    with conn, conn.cursor() as cur:
-        cur.execute(
-            "SELECT shop_id, access_token FROM shopify.shops WHERE shop_domain = %s",
-            (shop_domain,),
-        )
-        row = cur.fetchone()
-
-        if not row:
-            raise HTTPException(404, "Shop not found")
+    creds = await get_shop_creds(shop_domain)
+    if not creds:
+        raise HTTPException(404, "Shop not found")
 
-        shop_id = row["shop_id"]
-        access_token = row["access_token"]
+    shop_id, access_token = creds
 
     background_tasks.add_task(sync_customers, shop_domain, shop_id, access_token)
 
@@ -1920,19 +2229,11 @@ async def trigger_product_sync(
     shop_domain: str, background_tasks: BackgroundTasks
 ):
     """Manually trigger a product sync for a shop."""
-    conn = db()
-    with conn, conn.cursor() as cur:
-        cur.execute(
-            "SELECT shop_id, access_token FROM shopify.shops WHERE shop_domain = %s",
-            (shop_domain,),
-        )
-        row = cur.fetchone()
-
-        if not row:
-            raise HTTPException(404, "Shop not found")
+    creds = await get_shop_creds(shop_domain)
+    if not creds:
+        raise HTTPException(404, "Shop not found")
 
-        shop_id = row["shop_id"]
-        access_token = row["access_token"]
+    shop_id, access_token = creds
 
     background_tasks.add_task(sync_products, shop_domain, shop_id, access_token)
 
@@ -1947,19 +2248,11 @@ async def trigger_variant_sync(
     shop_domain: str, background_tasks: BackgroundTasks
 ):
     """Manually trigger a product variants sync for a shop."""
-    conn = db()
-    with conn, conn.cursor() as cur:
-        cur.execute(
-            "SELECT shop_id, access_token FROM shopify.shops WHERE shop_domain = %s",
-            (shop_domain,),
-        )
-        row = cur.fetchone()
-
-        if not row:
-            raise HTTPException(404, "Shop not found")
+    creds = await get_shop_creds(shop_domain)
+    if not creds:
+        raise HTTPException(404, "Shop not found")
 
-        shop_id = row["shop_id"]
-        access_token = row["access_token"]
+    shop_id, access_token = creds
 
     background_tasks.add_task(sync_product_variants, shop_domain, shop_id, access_token)
 
@@ -1974,19 +2267,11 @@ async def trigger_line_items_sync(
     shop_domain: str, background_tasks: BackgroundTasks
 ):
     """Manually trigger an order line items sync for a shop."""
-    conn = db()
-    with conn, conn.cursor() as cur:
-        cur.execute(
-            "SELECT shop_id, access_token FROM shopify.shops WHERE shop_domain = %s",
-            (shop_domain,),
-        )
-        row = cur.fetchone()
-
-        if not row:
-            raise HTTPException(404, "Shop not found")
+    creds = await get_shop_creds(shop_domain)
+    if not creds:
+        raise HTTPException(404, "Shop not found")
 
-        shop_id = row["shop_id"]
-        access_token = row["access_token"]
+    shop_id, access_token = creds
 
     background_tasks.add_task(sync_order_line_items, shop_domain, shop_id, access_token)
 
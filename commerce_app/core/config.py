@@ -11,3 +11,9 @@ DB_SSLMODE = os.getenv("DB_SSLMODE", "require")  # 'require' for RDS/Aurora
 DATABASE_DSN = (
     f"host={DB_HOST} dbname={DB_NAME} user={DB_USER} password={DB_PASSWORD} sslmode={DB_SSLMODE}"
 )
+
+# Connection pool sizing; each running sync holds one connection for its
+# ingest transaction and borrows another for progress updates
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
@@ -1,7 +1,7 @@
 # commerce_app/core/db.py
 from contextlib import asynccontextmanager
 from psycopg_pool import AsyncConnectionPool
-from .config import DATABASE_DSN
+from .config import DATABASE_DSN, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_MAX_IDLE
 
 _pool: AsyncConnectionPool | None = None
 
@@ -11,8 +11,9 @@ async def init_pool() -> AsyncConnectionPool:
     if _pool is None:
         _pool = AsyncConnectionPool(
             conninfo=DATABASE_DSN,
-            min_size=1,
-            max_size=5,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            max_idle=DB_POOL_MAX_IDLE,
             open=True,   # open immediately; fail-fast if DSN wrong
             timeout=10,
         )
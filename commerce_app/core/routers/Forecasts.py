@@ -1,13 +1,18 @@
 # commerce_app/core/routers/forecasts.py
 from fastapi import APIRouter, HTTPException, Depends
 from commerce_app.core.db import get_conn
+from commerce_app.api.http_cache import ETagRoute
 from commerce_app.auth.session_tokens import verify_shopify_session_token
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Tuple
 import statistics
 import math  # NEW
+from operator import itemgetter
 
-router = APIRouter()
+router = APIRouter(route_class=ETagRoute)
+
+_total_spent = itemgetter("total_spent")
+_predicted_clv = itemgetter("predicted_clv")
 
 
 def get_shop_from_token(payload: Dict[str, Any] = Depends(verify_shopify_session_token)) -> str:
@@ -576,7 +581,7 @@ async def forecast_customer_lifetime_value(
                         segment_summary[seg_type] = {
                             "count": len(seg_customers),
                             "avg_clv": round(statistics.mean([c['predicted_clv'] for c in seg_customers]), 2),
-                            "total_value": round(sum([c['total_spent'] for c in seg_customers]), 2)
+                            "total_value": round(sum(map(_total_spent, seg_customers)), 2)
                         }
 
                 return {
@@ -584,7 +589,7 @@ async def forecast_customer_lifetime_value(
                     "summary": {
                         "total_customers": len(customers),
                         "avg_customer_lifetime_value": round(statistics.mean([c['predicted_clv'] for c in customers]), 2) if customers else 0,
-                        "total_predicted_value": round(sum([c['predicted_clv'] for c in customers]), 2) if customers else 0,
+                        "total_predicted_value": round(sum(map(_predicted_clv, customers)), 2) if customers else 0,
                         "high_churn_risk": len([c for c in customers if c['churn_risk'] == 'high']),
                         "segment_breakdown": segment_summary
                     }
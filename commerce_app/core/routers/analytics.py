@@ -1,13 +1,14 @@
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import StreamingResponse
 from commerce_app.core.db import get_conn
+from commerce_app.api.http_cache import ETagRoute
 from commerce_app.auth.session_tokens import verify_shopify_session_token
 from typing import List, Dict, Any, Optional
 from io import BytesIO
 from datetime import datetime
 import pandas as pd
 
-router = APIRouter()
+router = APIRouter(route_class=ETagRoute)
 
 
 def get_shop_from_token(payload: Dict[str, Any] = Depends(verify_shopify_session_token)) -> str:
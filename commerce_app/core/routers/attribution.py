@@ -5,6 +5,7 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
 from fastapi.responses import StreamingResponse
 from commerce_app.core.db import get_conn
+from commerce_app.api.http_cache import ETagRoute
 from commerce_app.auth.session_tokens import verify_shopify_session_token
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
@@ -14,7 +15,7 @@ import urllib.parse as urlparse
 from collections import defaultdict
 import pandas as pd
 
-router = APIRouter()
+router = APIRouter(route_class=ETagRoute)
 
 
 def get_shop_from_session(session: Dict[str, Any]) -> str:
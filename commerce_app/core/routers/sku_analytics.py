@@ -1,12 +1,13 @@
 # commerce_app/core/routers/sku_analytics.py
 from fastapi import APIRouter, HTTPException, Query, Depends
 from commerce_app.core.db import get_conn
+from commerce_app.api.http_cache import ETagRoute
 from commerce_app.auth.session_tokens import verify_shopify_session_token
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 from collections import defaultdict
 
-router = APIRouter()
+router = APIRouter(route_class=ETagRoute)
 
 
 def get_shop_from_token(payload: Dict[str, Any] = Depends(verify_shopify_session_token)) -> str:
@@ -196,11 +197,18 @@ async def sku_overview(
     # Limit results
     limited_skus = skus[:limit]
     
-    # Calculate summary statistics
-    total_revenue = sum(s["total_revenue"] for s in skus)
-    total_quantity = sum(s["total_quantity"] for s in skus)
-    total_profit = sum(s["total_profit"] for s in skus if s["total_profit"] is not None)
-    skus_with_profit = len([s for s in skus if s["total_profit"] is not None])
+    # Calculate summary statistics in a single pass
+    total_revenue = 0
+    total_quantity = 0
+    total_profit = 0
+    skus_with_profit = 0
+    for s in skus:
+        total_revenue += s["total_revenue"]
+        total_quantity += s["total_quantity"]
+        profit = s["total_profit"]
+        if profit is not None:
+            total_profit += profit
+            skus_with_profit += 1
     
     return {
         "skus": limited_skus,
@@ -104,9 +104,48 @@ async def process_webhook(shop_domain: str, topic: str, payload: dict, webhook_r
                 await conn.rollback()
 
 
-async def process_order_webhook(cur, shop_id: int, payload: dict):
+ORDER_COLUMNS = (
+    "shop_id",
+    "order_id",
+    "customer_id",
+    "email",
+    "name",
+    "order_number",
+    "processed_at",
+    "financial_status",
+    "fulfillment_status",
+    "currency",
+    "subtotal_price",
+    "total_discounts",
+    "total_tax",
+    "shipping_price",
+    "total_price",
+    "line_items",
+    "raw_json",
+    "created_at",
+    "order_date",
+    "updated_at",
+)
+
+# Everything except the key and created_at is refreshed on conflict
+_ORDER_UPDATE_SET = ",\n            ".join(
+    f"{c} = EXCLUDED.{c}"
+    for c in ORDER_COLUMNS
+    if c not in ("shop_id", "order_id", "created_at")
+)
+
+_UPSERT_ORDER_SQL = f"""
+        INSERT INTO shopify.orders ({", ".join(ORDER_COLUMNS)})
+        VALUES ({", ".join(["%s"] * len(ORDER_COLUMNS))})
+        ON CONFLICT (shop_id, order_id)
+        DO UPDATE SET
+            {_ORDER_UPDATE_SET};
+        """
+
+
+def order_row(shop_id: int, payload: dict) -> tuple:
     """
-    Process orders/create and orders/updated webhooks.
+    Map an order payload onto ORDER_COLUMNS.
     UPDATED: Now extracts order_date from created_at
     """
     order_id = payload.get("id")
@@ -150,77 +189,86 @@ async def process_order_webhook(cur, shop_id: int, payload: dict):
             except:
                 pass
     
-    # Upsert order data with ALL fields including order_date
+    return (
+        shop_id,
+        order_id,
+        customer_id,
+        email,
+        payload.get("name"),  # Order name like "#1001"
+        order_number,
+        payload.get("processed_at"),
+        payload.get("financial_status"),
+        payload.get("fulfillment_status"),
+        payload.get("currency", "USD"),
+        payload.get("subtotal_price", "0.00"),
+        payload.get("total_discounts", "0.00"),
+        payload.get("total_tax", "0.00"),
+        shipping_price,
+        payload.get("total_price", "0.00"),
+        json.dumps(payload.get("line_items", [])),  # Store product info
+        json.dumps(payload),  # Store complete webhook for debugging
+        payload.get("created_at"),  # Full TIMESTAMPTZ
+        order_date,    # DATE for analytics/forecasts
+        payload.get("updated_at")
+    )
+
+
+async def copy_orders(cur, rows: list) -> None:
+    """
+    Bulk-apply order_row() tuples: COPY into a session temp table, then one
+    upsert into shopify.orders. Existing line items for the staged orders
+    are cleared, as process_order_webhook does; the line-items sync stage
+    repopulates them.
+
+    The stage is emptied after each merge, so several calls may share one
+    transaction.
+    """
+    if not rows:
+        return
+    cols = ", ".join(ORDER_COLUMNS)
     await cur.execute(
+        f"""
+        CREATE TEMP TABLE IF NOT EXISTS orders_stage
+        ON COMMIT DELETE ROWS
+        AS SELECT {cols} FROM shopify.orders WITH NO DATA;
         """
-        INSERT INTO shopify.orders (
-            shop_id,
-            order_id,
-            customer_id,
-            email,
-            name,
-            order_number,
-            processed_at,
-            financial_status,
-            fulfillment_status,
-            currency,
-            subtotal_price,
-            total_discounts,
-            total_tax,
-            shipping_price,
-            total_price,
-            line_items,
-            raw_json,
-            created_at,
-            order_date,
-            updated_at
-        ) VALUES (
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-        )
-        ON CONFLICT (shop_id, order_id) 
+    )
+    async with cur.copy(f"COPY orders_stage ({cols}) FROM STDIN") as copy:
+        for row in rows:
+            await copy.write_row(row)
+    await cur.execute(
+        f"""
+        INSERT INTO shopify.orders ({cols})
+        SELECT DISTINCT ON (shop_id, order_id) {cols}
+        FROM orders_stage
+        ORDER BY shop_id, order_id
+        ON CONFLICT (shop_id, order_id)
         DO UPDATE SET
-            customer_id = EXCLUDED.customer_id,
-            email = EXCLUDED.email,
-            name = EXCLUDED.name,
-            order_number = EXCLUDED.order_number,
-            processed_at = EXCLUDED.processed_at,
-            financial_status = EXCLUDED.financial_status,
-            fulfillment_status = EXCLUDED.fulfillment_status,
-            currency = EXCLUDED.currency,
-            subtotal_price = EXCLUDED.subtotal_price,
-            total_discounts = EXCLUDED.total_discounts,
-            total_tax = EXCLUDED.total_tax,
-            shipping_price = EXCLUDED.shipping_price,
-            total_price = EXCLUDED.total_price,
-            line_items = EXCLUDED.line_items,
-            raw_json = EXCLUDED.raw_json,
-            order_date = EXCLUDED.order_date,
-            updated_at = EXCLUDED.updated_at;
-        """,
-        (
-            shop_id,
-            order_id,
-            customer_id,
-            email,
-            payload.get("name"),  # Order name like "#1001"
-            order_number,
-            payload.get("processed_at"),
-            payload.get("financial_status"),
-            payload.get("fulfillment_status"),
-            payload.get("currency", "USD"),
-            payload.get("subtotal_price", "0.00"),
-            payload.get("total_discounts", "0.00"),
-            payload.get("total_tax", "0.00"),
-            shipping_price,
-            payload.get("total_price", "0.00"),
-            json.dumps(payload.get("line_items", [])),  # Store product info
-            json.dumps(payload),  # Store complete webhook for debugging
-            payload.get("created_at"),  # Full TIMESTAMPTZ
-            order_date,    # DATE for analytics/forecasts
-            payload.get("updated_at")
-        )
+            {_ORDER_UPDATE_SET};
+        """
     )
+    await cur.execute(
+        """
+        DELETE FROM shopify.order_line_items li
+        USING orders_stage s
+        WHERE li.shop_id = s.shop_id AND li.order_id = s.order_id;
+        """
+    )
+    await cur.execute("TRUNCATE orders_stage")
+
+
+async def process_order_webhook(cur, shop_id: int, payload: dict):
+    """
+    Process orders/create and orders/updated webhooks.
+    UPDATED: Now extracts order_date from created_at
+    """
+    row = order_row(shop_id, payload)
+    order_id = row[1]
+    email = row[3]
+    order_date = row[18]
+
+    # Upsert order data with ALL fields including order_date
+    await cur.execute(_UPSERT_ORDER_SQL, row)
     
     # ==========================================
     # UPDATED: Process line items with LEFT JOIN approach
@@ -282,13 +330,7 @@ async def process_order_webhook(cur, shop_id: int, payload: dict):
 # ============================================================================
 # UPDATED: process_product_webhook - Now handles variants with shop_id
 # ============================================================================
-async def process_product_webhook(cur, shop_id: int, payload: dict):
-    """Process products/create and products/update webhooks."""
-    product_id = payload.get("id")
-    
-    # Insert/update product
-    await cur.execute(
-        """
+_UPSERT_PRODUCT_SQL = """
         INSERT INTO shopify.products (
             shop_id,
             product_id,
@@ -314,33 +356,9 @@ async def process_product_webhook(cur, shop_id: int, payload: dict):
             status = EXCLUDED.status,
             updated_at = EXCLUDED.updated_at,
             raw_json = EXCLUDED.raw_json;
-        """,
-        (
-            shop_id,
-            product_id,
-            payload.get("title"),
-            payload.get("handle"),
-            payload.get("vendor"),
-            payload.get("product_type") or payload.get("productType"),  # Handle both formats
-            payload.get("tags"),
-            payload.get("status"),
-            payload.get("created_at") or payload.get("createdAt"),
-            payload.get("updated_at") or payload.get("updatedAt"),
-            json.dumps(payload)
-        )
-    )
-    
-    # NEW: Process variants
-    variants = payload.get("variants", [])
-    
-    for variant in variants:
-        variant_id = variant.get("id")
-        
-        if not variant_id:
-            continue
-        
-        await cur.execute(
-            """
+        """
+
+_UPSERT_VARIANT_SQL = """
             INSERT INTO shopify.product_variants (
                 shop_id,
                 variant_id,
@@ -392,34 +410,90 @@ async def process_product_webhook(cur, shop_id: int, payload: dict):
                 inventory_quantity = EXCLUDED.inventory_quantity,
                 old_inventory_quantity = EXCLUDED.old_inventory_quantity,
                 requires_shipping = EXCLUDED.requires_shipping;
-            """,
-            (
-                shop_id,  # NEW: shop_id included
-                variant_id,
-                product_id,
-                variant.get("title"),
-                variant.get("price"),
-                variant.get("sku"),
-                variant.get("position"),
-                variant.get("inventory_policy") or variant.get("inventoryPolicy"),
-                variant.get("compare_at_price") or variant.get("compareAtPrice"),
-                variant.get("fulfillment_service") or variant.get("fulfillmentService"),
-                variant.get("inventory_management") or variant.get("inventoryManagement"),
-                variant.get("option1"),
-                variant.get("option2"),
-                variant.get("option3"),
-                variant.get("created_at") or variant.get("createdAt"),
-                variant.get("updated_at") or variant.get("updatedAt"),
-                variant.get("taxable"),
-                variant.get("barcode"),
-                variant.get("weight"),
-                variant.get("weight_unit") or variant.get("weightUnit"),
-                variant.get("inventory_item_id") or variant.get("inventoryItemId"),
-                variant.get("inventory_quantity") or variant.get("inventoryQuantity"),
-                variant.get("old_inventory_quantity") or variant.get("oldInventoryQuantity"),
-                variant.get("requires_shipping") or variant.get("requiresShipping")
-            )
-        )
+            """
+
+
+def product_row(shop_id: int, payload: dict) -> tuple:
+    """Map a product payload (REST or bulk GraphQL keys) onto the products upsert."""
+    return (
+        shop_id,
+        payload.get("id"),
+        payload.get("title"),
+        payload.get("handle"),
+        payload.get("vendor"),
+        payload.get("product_type") or payload.get("productType"),  # Handle both formats
+        payload.get("tags"),
+        payload.get("status"),
+        payload.get("created_at") or payload.get("createdAt"),
+        payload.get("updated_at") or payload.get("updatedAt"),
+        json.dumps(payload)
+    )
+
+
+def variant_row(shop_id: int, product_id, variant: dict) -> tuple:
+    """Map a variant payload (REST or bulk GraphQL keys) onto the variants upsert."""
+    return (
+        shop_id,  # NEW: shop_id included
+        variant.get("id"),
+        product_id,
+        variant.get("title"),
+        variant.get("price"),
+        variant.get("sku"),
+        variant.get("position"),
+        variant.get("inventory_policy") or variant.get("inventoryPolicy"),
+        variant.get("compare_at_price") or variant.get("compareAtPrice"),
+        variant.get("fulfillment_service") or variant.get("fulfillmentService"),
+        variant.get("inventory_management") or variant.get("inventoryManagement"),
+        variant.get("option1"),
+        variant.get("option2"),
+        variant.get("option3"),
+        variant.get("created_at") or variant.get("createdAt"),
+        variant.get("updated_at") or variant.get("updatedAt"),
+        variant.get("taxable"),
+        variant.get("barcode"),
+        variant.get("weight"),
+        variant.get("weight_unit") or variant.get("weightUnit"),
+        variant.get("inventory_item_id") or variant.get("inventoryItemId"),
+        variant.get("inventory_quantity") or variant.get("inventoryQuantity"),
+        variant.get("old_inventory_quantity") or variant.get("oldInventoryQuantity"),
+        variant.get("requires_shipping") or variant.get("requiresShipping")
+    )
+
+
+async def upsert_products(cur, shop_id: int, payloads: list) -> int:
+    """
+    Batch form of process_product_webhook: one executemany for the products,
+    one for all of their variants. Returns the number of variants written.
+    """
+    variant_rows = [
+        variant_row(shop_id, payload.get("id"), variant)
+        for payload in payloads
+        for variant in payload.get("variants", [])
+        if variant.get("id")
+    ]
+    await cur.executemany(
+        _UPSERT_PRODUCT_SQL, [product_row(shop_id, payload) for payload in payloads]
+    )
+    if variant_rows:
+        await cur.executemany(_UPSERT_VARIANT_SQL, variant_rows)
+    return len(variant_rows)
+
+
+async def process_product_webhook(cur, shop_id: int, payload: dict):
+    """Process products/create and products/update webhooks."""
+    product_id = payload.get("id")
+    
+    # Insert/update product
+    await cur.execute(_UPSERT_PRODUCT_SQL, product_row(shop_id, payload))
+    
+    # NEW: Process variants
+    variants = payload.get("variants", [])
+    
+    for variant in variants:
+        if not variant.get("id"):
+            continue
+        
+        await cur.execute(_UPSERT_VARIANT_SQL, variant_row(shop_id, product_id, variant))
     
     print(f"✅ Processed product {payload.get('title')} with {len(variants)} variants")
 
@@ -1,6 +1,7 @@
 import os, httpx, asyncio
 from dotenv import load_dotenv
 from typing import AsyncIterator, Dict, List, Optional, Tuple
+from commerce_app.core.http import get_client
 load_dotenv()
 
 BASE = f"{os.environ['SHOP_URL']}/admin/api/{os.environ.get('API_VERSION','2024-10')}"
@@ -10,13 +11,11 @@ HEADERS = {
 }
 
 async def get_orders(limit=10):
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(f"{BASE}/orders.json", params={"limit": limit}, headers=HEADERS)
-        r.raise_for_status()
-        return r.json()["orders"]
+    r = await get_client().get(f"{BASE}/orders.json", params={"limit": limit}, headers=HEADERS)
+    r.raise_for_status()
+    return r.json()["orders"]
 
 async def get_customers(limit=10):
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(f"{BASE}/customers.json", params={"limit": limit}, headers=HEADERS)
-        r.raise_for_status()
-        return r.json()["customers"]
+    r = await get_client().get(f"{BASE}/customers.json", params={"limit": limit}, headers=HEADERS)
+    r.raise_for_status()
+    return r.json()["customers"]
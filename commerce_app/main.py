@@ -1,5 +1,18 @@
 # commerce_app/main.py
+import os
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run("commerce_app.app:app", host="0.0.0.0", port=8080, reload=True)
+    uvicorn.run(
+        "commerce_app.app:app",
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", 8080)),
+        # One worker by default: the per-shop locks, the shop credentials
+        # cache and the REST rate-limit buckets in auth.shopify_oauth live in
+        # process memory, so each extra worker gets its own copy of them
+        workers=int(os.environ.get("WEB_CONCURRENCY", 1)),
+        loop="uvloop",
+        http="httptools",
+        proxy_headers=True,
+        log_level="info",
+    )